@@ -1,25 +1,123 @@
+import os
+from datetime import timedelta
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from config import Config
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from config import config_by_name
 from models import db 
+from database import configure_sqlite
 from auth import auth_bp
 from routes import main_bp
+from graph import family_graph
+from avatars import migrate_inline_pictures
+from conversations import rebuild_conversation_summaries
+from counters import repair_counters
+from bulk import parse_csv, parse_gedcom, import_relationships
+from cache import response_cache
+from profiles import profile_cache
+from passwords import password_hasher
+from sessions import session_cache, load_current_user
+from message_writer import message_writer
+from archive import archive_messages
+from profiling import request_profiler
+from stamps import shared_state
 
 app = Flask(__name__)
 CORS(app)
-app.config.from_object(Config)
+app.config.from_object(config_by_name[os.environ.get("APP_ENV", "development")])
+if not app.config["SECRET_KEY"]:
+    # Anyone who knows the development key could forge session tokens
+    raise RuntimeError("SECRET_KEY must be set in the environment")
 
 db.init_app(app)
 migrate = Migrate(app, db)
 
+response_cache.max_entries = app.config["RESPONSE_CACHE_SIZE"]
+profile_cache.max_entries = app.config["PROFILE_CACHE_SIZE"]
+password_hasher.configure(
+    app.config["PASSWORD_HASH_METHOD"],
+    app.config["PASSWORD_HASH_WORKERS"],
+    app.config["PASSWORD_HASH_MAX_PENDING"],
+    app.config["PASSWORD_HASH_TIMEOUT"]
+)
+session_cache.max_entries = app.config["SESSION_CACHE_SIZE"]
+session_cache.ttl = app.config["SESSION_CACHE_TTL"]
+if app.config["PROFILING"]:
+    # Before load_current_user, so session lookups count towards the request
+    request_profiler.configure(app, app.config["PROFILING_SLOW_STATEMENTS"])
+shared_state.configure(app.config["SHARED_STATE_SYNC"], app.config["SHARED_STATE_CHECK_SECONDS"])
+app.before_request(shared_state.check)
+app.before_request(load_current_user)
+message_writer.configure(
+    app,
+    app.config["MESSAGE_BATCH_MAX"],
+    app.config["MESSAGE_BATCH_WAIT"],
+    app.config["MESSAGE_BATCH_MAX_PENDING"],
+    app.config["MESSAGE_BATCH_TIMEOUT"]
+)
+
 app.register_blueprint(auth_bp, url_prefix = "/auth")
 app.register_blueprint(main_bp)
 
+with app.app_context():
+    for engine in db.engines.values():
+        configure_sqlite(engine, app.config["SQLITE_PRAGMAS"])
+    try:
+        family_graph.load()
+    except (OperationalError, ProgrammingError):
+        # Tables don't exist yet (e.g. before init_db); the index loads on first use
+        db.session.rollback()
+
+@app.cli.command("migrate-avatars")
+def migrate_avatars():
+    """Move base64 profile pictures from the user table into the avatar store."""
+    moved, failed = migrate_inline_pictures()
+    print(f"Moved {moved} pictures ({failed} could not be decoded)")
+
+@app.cli.command("rebuild-conversations")
+def rebuild_conversations():
+    """Recompute conversation summaries from the message table."""
+    count = rebuild_conversation_summaries()
+    print(f"Rebuilt {count} conversation summaries")
+
+@app.cli.command("repair-counters")
+def repair_badge_counters():
+    """Recompute unread and pending-request counters from the source tables."""
+    count = repair_counters()
+    print(f"Recomputed counters for {count} users")
+
+@app.cli.command("archive-messages")
+@click.option("--days", type=int, default=None,
+              help="Archive messages older than this many days (default MESSAGE_ARCHIVE_AFTER_DAYS).")
+def archive_old_messages(days):
+    """Move old, read messages into compressed per-conversation archive segments."""
+    days = app.config["MESSAGE_ARCHIVE_AFTER_DAYS"] if days is None else days
+    moved, segments = archive_messages(timedelta(days=days), app.config["MESSAGE_ARCHIVE_SEGMENT_SIZE"])
+    print(f"Archived {moved} messages into {segments} segments")
+
+@app.cli.command("import-relationships")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "gedcom"]), default=None,
+              help="Defaults to gedcom for .ged files, otherwise csv.")
+@click.option("--approve", is_flag=True, help="Approve links whose reverse relationship is known.")
+def import_relationships_command(path, fmt, approve):
+    """Bulk-import relationships from a CSV or GEDCOM file."""
+    fmt = fmt or ("gedcom" if path.lower().endswith(".ged") else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        links = parse_csv(f) if fmt == "csv" else parse_gedcom(f)
+        try:
+            summary = import_relationships(links, approve, app.config["IMPORT_CHUNK_SIZE"])
+        finally:
+            # Tells the running server to drop its cached responses; the graph is reloaded the same way
+            response_cache.bump_all()
+    print(", ".join(f"{count} {outcome}" for outcome, count in summary.items()))
+
 @app.route("/")
 def home():
     return "Backend is working!"
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    app.run(debug=app.config["DEBUG"])
@@ -0,0 +1,114 @@
+import json
+import zlib
+from collections import namedtuple
+from datetime import datetime, timezone
+from sqlalchemy import and_, or_
+from models import db, Message, MessageArchive, ConversationSummary, unordered_pair
+
+# An archived message, with the attributes serialize_message reads
+ArchivedMessage = namedtuple("ArchivedMessage", "id sender_id recipient_id content timestamp")
+
+def pack_segment(messages):
+    rows = [[m.id, m.sender_id, m.recipient_id, m.content, m.timestamp.isoformat()] for m in messages]
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode(), 9)
+
+def unpack_segment(data):
+    return [
+        ArchivedMessage(message_id, sender_id, recipient_id, content, datetime.fromisoformat(timestamp))
+        for message_id, sender_id, recipient_id, content, timestamp in json.loads(zlib.decompress(data))
+    ]
+
+def _segments(user_a, user_b):
+    return MessageArchive.query.filter_by(user_low=min(user_a, user_b), user_high=max(user_a, user_b))
+
+def _hot_pair(user_a, user_b):
+    low, high = unordered_pair(Message.sender_id, Message.recipient_id)
+    return and_(low == min(user_a, user_b), high == max(user_a, user_b))
+
+def archive_conversation(user_a, user_b, cutoff, segment_size):
+    """
+    Move the oldest run of a conversation's messages into archive segments: everything
+    before its first message that was sent after cutoff, is still unread, or is the
+    latest (which the conversation summaries point to). Unread messages stay in the
+    message table so read watermarks and unread counts only ever involve hot rows.
+    Commits each segment; returns (messages, segments) archived.
+    """
+    summaries = {
+        summary.user_id: summary for summary in ConversationSummary.query.filter(or_(
+            and_(ConversationSummary.user_id == user_a, ConversationSummary.partner_id == user_b),
+            and_(ConversationSummary.user_id == user_b, ConversationSummary.partner_id == user_a)
+        ))
+    }
+    if len(summaries) < 2:
+        return 0, 0
+    latest = summaries[user_a].last_message_id
+    pair = _hot_pair(user_a, user_b)
+
+    keep_from = db.session.query(db.func.min(Message.id)).filter(pair, or_(
+        Message.timestamp >= cutoff,
+        and_(Message.recipient_id == user_a, Message.id > summaries[user_a].last_read_message_id),
+        and_(Message.recipient_id == user_b, Message.id > summaries[user_b].last_read_message_id),
+        Message.id >= latest
+    )).scalar() or latest
+
+    moved = segments = 0
+    while True:
+        messages = Message.query.filter(pair, Message.id < keep_from).order_by(Message.id).limit(segment_size).all()
+        if not messages:
+            break
+        db.session.add(MessageArchive(
+            user_low=min(user_a, user_b),
+            user_high=max(user_a, user_b),
+            first_message_id=messages[0].id,
+            last_message_id=messages[-1].id,
+            message_count=len(messages),
+            data=pack_segment(messages)
+        ))
+        Message.query.filter(Message.id.in_([m.id for m in messages])).delete(synchronize_session=False)
+        db.session.commit()
+        moved += len(messages)
+        segments += 1
+    return moved, segments
+
+def archive_messages(older_than, segment_size):
+    """Archive messages sent more than older_than (a timedelta) ago, conversation by conversation"""
+    # Message timestamps are naive UTC (CURRENT_TIMESTAMP)
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - older_than
+    low, high = unordered_pair(Message.sender_id, Message.recipient_id)
+    pairs = db.session.query(low, high).filter(Message.timestamp < cutoff).distinct().all()
+
+    moved = segments = 0
+    for user_low, user_high in pairs:
+        pair_moved, pair_segments = archive_conversation(user_low, user_high, cutoff, segment_size)
+        moved += pair_moved
+        segments += pair_segments
+    return moved, segments
+
+def archived_before(user_a, user_b, before_id, limit):
+    """Up to limit archived messages older than before_id (None: the newest), newest first"""
+    found = []
+    while len(found) < limit:
+        query = _segments(user_a, user_b)
+        if before_id is not None:
+            query = query.filter(MessageArchive.first_message_id < before_id)
+        segment = query.order_by(MessageArchive.last_message_id.desc()).first()
+        if segment is None:
+            break
+        for message in reversed(unpack_segment(segment.data)):
+            if before_id is None or message.id < before_id:
+                found.append(message)
+        before_id = segment.first_message_id
+    return found[:limit]
+
+def archived_after(user_a, user_b, after_id, limit):
+    """Up to limit archived messages newer than after_id, oldest first"""
+    found = []
+    while len(found) < limit:
+        segment = _segments(user_a, user_b).filter(
+            MessageArchive.last_message_id > after_id
+        ).order_by(MessageArchive.last_message_id).first()
+        if segment is None:
+            break
+        found.extend(message for message in unpack_segment(segment.data) if message.id > after_id)
+        after_id = segment.last_message_id
+    return found[:limit]
@@ -1,23 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, g
 from models import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
+from avatars import AvatarError, set_profile_pic
+from cache import USERS, response_cache
+from passwords import HasherBusy, password_hasher
+from profiles import profile_cache, view_profile
+from sessions import session_cache, request_token
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
-    hashed_password = generate_password_hash(data['password'])
+    try:
+        hashed_password = password_hasher.hash(data['password'])
+    except HasherBusy:
+        return jsonify({'error': 'Server busy, please try again'}), 503
     new_user = User(
         name=data['name'], 
         email=data['email'], 
         password=hashed_password,
-        gender=data.get('gender'),
-        profile_pic=data.get('profile_pic')
+        gender=data.get('gender')
     )
+    try:
+        set_profile_pic(new_user, data.get('profile_pic'))
+    except AvatarError as e:
+        return jsonify({'error': str(e)}), 400
     try:
         db.session.add(new_user)
         db.session.commit()
+        response_cache.bump(USERS)
         return jsonify({'message': 'User registered successfully'})
     except Exception as e:
         return jsonify({'error': 'User with this email already exists'}), 400
@@ -26,6 +37,38 @@ def register():
 def login():
     data = request.json
     user = User.query.filter_by(email=data["email"]).first()
-    if user and check_password_hash(user.password, data["password"]):
-        return jsonify({"message": "Login successful!"})
+    try:
+        if user and password_hasher.check(user.password, data["password"]):
+            # Upgrade hashes made with older cost parameters while we have the password
+            if password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.hash(data["password"])
+            token = session_cache.issue(user.id)
+            db.session.commit()
+            # The client keeps the token and its own profile, so pages don't have to look the user up
+            return jsonify({
+                "message": "Login successful!",
+                "token": token,
+                "user": view_profile(profile_cache.get(user.id), user.id)
+            })
+    except HasherBusy:
+        return jsonify({"error": "Server busy, please try again"}), 503
     return jsonify({"error": "Invalid credentials"}), 401
+
+@auth_bp.route('/logout', methods=['POST'])
+def logout():
+    token = request_token()
+    if g.get("user_id") is None:
+        return jsonify({"error": "Not logged in"}), 401
+    session_cache.revoke(token)
+    db.session.commit()
+    return jsonify({"message": "Logged out"})
+
+@auth_bp.route('/stream_ticket', methods=['POST'])
+def stream_ticket():
+    """A ticket for ?ticket= on /events, valid for STREAM_TICKET_MAX_AGE seconds"""
+    if g.get("user_id") is None:
+        return jsonify({"error": "Not logged in"}), 401
+    return jsonify({
+        "ticket": session_cache.issue_ticket(request_token()),
+        "expires_in": current_app.config["STREAM_TICKET_MAX_AGE"]
+    })
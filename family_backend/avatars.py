@@ -0,0 +1,165 @@
+import base64
+import binascii
+import hashlib
+import os
+from io import BytesIO
+from flask import current_app, url_for
+from models import db, User
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow every size is served from the original upload
+    Image = None
+
+# Longest edge in pixels for each generated thumbnail
+THUMBNAIL_SIZES = {
+    "small": 64,
+    "medium": 256,
+}
+AVATAR_SIZES = ("original",) + tuple(THUMBNAIL_SIZES)
+
+# Magic number -> (file extension, mimetype)
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ("png", "image/png")),
+    (b"\xff\xd8\xff", ("jpg", "image/jpeg")),
+    (b"GIF87a", ("gif", "image/gif")),
+    (b"GIF89a", ("gif", "image/gif")),
+]
+MIMETYPES = {ext: mimetype for _, (ext, mimetype) in IMAGE_SIGNATURES}
+MIMETYPES["webp"] = "image/webp"
+
+class AvatarError(ValueError):
+    pass
+
+def is_inline_image(value):
+    """True for the base64 data the frontend uploads, False for external URLs"""
+    return bool(value) and not value.startswith(("http://", "https://"))
+
+def _detect_format(data):
+    for signature, fmt in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return fmt
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+def _storage_dir():
+    return current_app.config.get("AVATAR_DIR") or os.path.join(current_app.instance_path, "avatars")
+
+def _blob_dir(digest):
+    return os.path.join(_storage_dir(), digest[:2], digest)
+
+def decode_upload(value):
+    """Decode a base64 string or data URL into raw image bytes"""
+    if value.startswith("data:"):
+        _, _, value = value.partition(",")
+    try:
+        data = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        raise AvatarError("Profile picture is not valid base64 image data")
+
+    if len(data) > current_app.config["AVATAR_MAX_BYTES"]:
+        raise AvatarError("Profile picture is too large")
+    return data
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _make_thumbnail(data, edge):
+    with Image.open(BytesIO(data)) as img:
+        img.thumbnail((edge, edge))
+        out = BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(out, format="PNG", optimize=True)
+            return "png", out.getvalue()
+        img.convert("RGB").save(out, format="JPEG", quality=85)
+        return "jpg", out.getvalue()
+
+def store_avatar(value):
+    """
+    Store an uploaded picture under its SHA-256 and generate thumbnails.
+    Returns the hex digest; identical uploads share one set of files.
+    """
+    data = decode_upload(value)
+    fmt = _detect_format(data)
+    if not fmt:
+        raise AvatarError("Profile picture must be a PNG, JPEG, GIF or WebP image")
+
+    digest = hashlib.sha256(data).hexdigest()
+    if find_avatar_file(digest, "original"):
+        return digest
+
+    directory = _blob_dir(digest)
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(os.path.join(directory, f"original.{fmt[0]}"), data)
+
+    if Image is not None:
+        for size, edge in THUMBNAIL_SIZES.items():
+            try:
+                ext, thumb = _make_thumbnail(data, edge)
+            except (OSError, ValueError):
+                continue  # Unreadable by Pillow; this size falls back to the original
+            _write_atomic(os.path.join(directory, f"{size}.{ext}"), thumb)
+
+    return digest
+
+def find_avatar_file(digest, size):
+    """Return (path, mimetype) for a stored size, falling back to the original"""
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        return None
+    directory = _blob_dir(digest)
+    if not os.path.isdir(directory):
+        return None
+
+    files = {name.split(".", 1)[0]: name for name in os.listdir(directory) if ".tmp" not in name}
+    name = files.get(size) or files.get("original")
+    if not name:
+        return None
+    return os.path.join(directory, name), MIMETYPES[name.rsplit(".", 1)[1]]
+
+def avatar_url(user, size="small"):
+    """URL for a user's picture: the blob store if uploaded, else any external URL they set"""
+    if user.avatar_hash:
+        return url_for("main.get_avatar", digest=user.avatar_hash, size=size, _external=True)
+    if user.profile_pic and not is_inline_image(user.profile_pic):
+        return user.profile_pic
+    return None
+
+def set_profile_pic(user, value):
+    """Apply a profile_pic value from a request: uploads go to the blob store, URLs are kept as-is"""
+    if not value:
+        user.avatar_hash = None
+        user.profile_pic = None
+    elif is_inline_image(value):
+        user.avatar_hash = store_avatar(value)
+        user.profile_pic = None
+    else:
+        user.avatar_hash = None
+        user.profile_pic = value
+
+def migrate_inline_pictures(batch_size=100):
+    """Move base64 pictures still stored on user rows into the blob store"""
+    moved = failed = 0
+    last_id = 0
+    while True:
+        users = User.query.filter(
+            User.id > last_id,
+            User.avatar_hash.is_(None),
+            User.profile_pic.isnot(None)
+        ).order_by(User.id).limit(batch_size).all()
+        if not users:
+            break
+        for user in users:
+            last_id = user.id
+            if not is_inline_image(user.profile_pic):
+                continue
+            try:
+                set_profile_pic(user, user.profile_pic)
+                moved += 1
+            except AvatarError:
+                failed += 1
+        db.session.commit()
+    return moved, failed
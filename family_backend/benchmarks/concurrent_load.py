@@ -0,0 +1,156 @@
+"""
+Load test: reader latency while other processes keep sending messages.
+
+Runs the same workload against two SQLite databases, one with the old defaults
+(rollback journal, synchronous=FULL) and one with Config.SQLITE_PRAGMAS (WAL,
+synchronous=NORMAL, busy timeout), both through the pooled engine options of
+ProductionConfig. Writer processes POST /send_message while reader threads GET
+/users/search and /badges; reader latency percentiles and failed writes
+("database is locked") are reported per mode.
+Writers run in separate processes, as other server workers or a bulk import
+would, so readers wait on the database lock rather than on the GIL.
+
+Usage (from family_backend/):
+    python benchmarks/concurrent_load.py --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import insert
+from config import Config, ProductionConfig
+from database import configure_sqlite
+from models import db, User, Relationship, Message
+from routes import main_bp
+from graph import family_graph
+
+MODES = [
+    ("rollback journal", {"journal_mode": "DELETE", "synchronous": "FULL"}),
+    ("WAL (Config)", Config.SQLITE_PRAGMAS),
+]
+
+def build_app(path, pragmas, users, messages):
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(main_bp)
+    # Locked-database errors are counted, not logged
+    app.logger.disabled = True
+
+    with app.app_context():
+        configure_sqlite(db.engine, pragmas)
+        db.create_all()
+        db.session.execute(insert(User), [
+            {"id": i, "name": f"User {i}", "email": f"user{i}@example.com", "password": "x"}
+            for i in range(1, users + 1)
+        ])
+        # Users 2k-1 and 2k are connected so writers can message each other
+        db.session.execute(insert(Relationship), [
+            {"from_user_id": i, "to_user_id": i + 1, "relationship_type": "Sibling",
+             "reverse_relationship_type": "Sibling", "status": "approved", "is_bidirectional": True}
+            for i in range(1, users, 2)
+        ])
+        rng = random.Random(1)
+        db.session.execute(insert(Message), [
+            {"sender_id": a, "recipient_id": a + 1, "content": "hello"}
+            for a in (rng.randrange(1, users, 2) for _ in range(messages))
+        ])
+        db.session.commit()
+        family_graph.invalidate()
+    return app
+
+def writer(app, users, seed, stop, writes, failures):
+    with app.app_context():
+        # Don't reuse connections inherited from the parent process
+        db.engine.dispose(close=False)
+    rng = random.Random(seed)
+    client = app.test_client()
+    count = failed = 0
+    while not stop.is_set():
+        sender = rng.randrange(1, users, 2)
+        response = client.post("/send_message", json={
+            "sender_id": sender, "recipient_id": sender + 1, "content": "load test"
+        })
+        if response.status_code == 200:
+            count += 1
+        else:
+            failed += 1
+    with writes.get_lock():
+        writes.value += count
+    with failures.get_lock():
+        failures.value += failed
+
+def run(app, users, readers, writers, seconds):
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+    writes = context.Value("i", 0)
+    failures = context.Value("i", 0)
+    latencies = []
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        local = []
+        while not stop.is_set():
+            if rng.random() < 0.5:
+                url = f"/users/search?q=user{rng.randint(1, users)}"
+            else:
+                url = f"/badges/{rng.randint(1, users)}"
+            start = time.perf_counter()
+            client.get(url)
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    # Fork the writers before starting any threads
+    processes = [
+        context.Process(target=writer, args=(app, users, 1000 + i, stop, writes, failures)) for i in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for process in processes:
+        process.join()
+    return sorted(latencies), writes.value, failures.value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':18} {'reads/s':>9} {'writes/s':>9} {'failed':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, pragmas in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(os.path.join(tmp, "load.db"), pragmas, args.users, args.messages)
+            latencies, writes, failed = run(app, args.users, args.readers, args.writers, args.seconds)
+            with app.app_context():
+                db.engine.dispose()
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+        print(f"{label:18} {len(latencies) / args.seconds:9.0f} {writes / args.seconds:9.0f} {failed:7} "
+              f"{pct(0.5):8.1f} {pct(0.95):8.1f} {pct(0.99):8.1f} {latencies[-1]:8.1f}")
+
+if __name__ == "__main__":
+    main()
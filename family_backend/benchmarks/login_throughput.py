@@ -0,0 +1,127 @@
+"""
+Benchmark: logins/sec and message latency while both run at once.
+
+Login threads POST /auth/login while message threads POST /send_message, first
+with passwords hashed inline on the request threads (PASSWORD_HASH_WORKERS=0),
+then through the process pool (ProductionConfig.PASSWORD_HASH_WORKERS).
+
+Usage (from family_backend/):
+    python benchmarks/login_throughput.py --logins 8 --senders 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import insert
+from config import ProductionConfig
+from database import configure_sqlite
+from models import db, User, Relationship
+from auth import auth_bp
+from routes import main_bp
+from graph import family_graph
+from passwords import password_hasher
+
+PASSWORD = "correct horse battery staple"
+
+def build_app(path, users):
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(auth_bp, url_prefix="/auth")
+    app.register_blueprint(main_bp)
+
+    # Every user shares one hash so setup doesn't take users * hash time
+    pwhash = password_hasher.hash(PASSWORD)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
+        db.create_all()
+        db.session.execute(insert(User), [
+            {"id": i, "name": f"User {i}", "email": f"user{i}@example.com", "password": pwhash}
+            for i in range(1, users + 1)
+        ])
+        db.session.execute(insert(Relationship), [
+            {"from_user_id": i, "to_user_id": i + 1, "relationship_type": "Sibling",
+             "reverse_relationship_type": "Sibling", "status": "approved", "is_bidirectional": True}
+            for i in range(1, users, 2)
+        ])
+        db.session.commit()
+        family_graph.invalidate()
+    return app
+
+def run(app, users, logins, senders, seconds):
+    stop = threading.Event()
+    lock = threading.Lock()
+    login_count = [0]
+    message_ms = []
+
+    def login(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        count = 0
+        while not stop.is_set():
+            response = client.post("/auth/login", json={
+                "email": f"user{rng.randint(1, users)}@example.com", "password": PASSWORD
+            })
+            if response.status_code == 200:
+                count += 1
+        with lock:
+            login_count[0] += count
+
+    def send(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        local = []
+        while not stop.is_set():
+            sender = rng.randrange(1, users, 2)
+            start = time.perf_counter()
+            client.post("/send_message", json={"sender_id": sender, "recipient_id": sender + 1, "content": "hi"})
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            message_ms.extend(local)
+
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(logins)]
+    threads += [threading.Thread(target=send, args=(1000 + i,)) for i in range(senders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return login_count[0], sorted(message_ms)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--senders", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    config = ProductionConfig
+    print(f"{os.cpu_count()} CPUs, {config.PASSWORD_HASH_METHOD}")
+    print(f"{'mode':16} {'logins/s':>9} {'msgs/s':>8} {'msg p50':>8} {'msg p95':>8} {'msg p99':>8}")
+    for label, workers in (("inline", 0), (f"pool ({config.PASSWORD_HASH_WORKERS} procs)", config.PASSWORD_HASH_WORKERS)):
+        password_hasher.configure(config.PASSWORD_HASH_METHOD, workers,
+                                  config.PASSWORD_HASH_MAX_PENDING, config.PASSWORD_HASH_TIMEOUT)
+        with tempfile.TemporaryDirectory() as tmp:
+            app = build_app(os.path.join(tmp, "login.db"), args.users)
+            logins, message_ms = run(app, args.users, args.logins, args.senders, args.seconds)
+            with app.app_context():
+                db.engine.dispose()
+
+        def pct(p):
+            return message_ms[min(len(message_ms) - 1, int(len(message_ms) * p))]
+        print(f"{label:16} {logins / args.seconds:9.1f} {len(message_ms) / args.seconds:8.0f} "
+              f"{pct(0.5):8.1f} {pct(0.95):8.1f} {pct(0.99):8.1f}")
+    password_hasher.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: messages/sec through /send_message with and without group commit.
+
+Sender threads POST /send_message as fast as they can, first with every message
+committed on its own request thread (MESSAGE_BATCH_MAX=1), then through the
+group-committing message writer (ProductionConfig.MESSAGE_BATCH_*), at each
+number of concurrent senders. --sync full makes every SQLite commit fsync
+(synchronous=FULL), as the rollback journal or a stricter deployment would;
+the default is Config.SQLITE_PRAGMAS (WAL, synchronous=NORMAL).
+
+Usage (from family_backend/):
+    python benchmarks/message_throughput.py --senders 1 16 128 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import insert, func, select
+from config import Config, ProductionConfig
+from database import configure_sqlite
+from models import db, User, Relationship, Message, UserCounters
+from routes import main_bp
+from graph import family_graph
+from message_writer import message_writer
+
+def build_app(path, users, pragmas, batch_max):
+    app = Flask(__name__)
+    app.config.from_object(ProductionConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    # Enough connections for every sender thread, so the pool isn't what's measured
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**app.config['SQLALCHEMY_ENGINE_OPTIONS'], "pool_size": 130}
+    db.init_app(app)
+    app.register_blueprint(main_bp)
+    app.logger.disabled = True
+    message_writer.configure(app, batch_max, app.config['MESSAGE_BATCH_WAIT'],
+                             app.config['MESSAGE_BATCH_MAX_PENDING'], app.config['MESSAGE_BATCH_TIMEOUT'])
+
+    with app.app_context():
+        configure_sqlite(db.engine, pragmas)
+        db.create_all()
+        db.session.execute(insert(User), [
+            {"id": i, "name": f"User {i}", "email": f"user{i}@example.com", "password": "x"}
+            for i in range(1, users + 1)
+        ])
+        db.session.execute(insert(Relationship), [
+            {"from_user_id": i, "to_user_id": i + 1, "relationship_type": "Sibling",
+             "reverse_relationship_type": "Sibling", "status": "approved", "is_bidirectional": True}
+            for i in range(1, users, 2)
+        ])
+        db.session.commit()
+        family_graph.invalidate()
+    return app
+
+def run(app, users, senders, seconds):
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies = []
+    failures = [0]
+
+    def send(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        local = []
+        failed = 0
+        while not stop.is_set():
+            sender = rng.randrange(1, users, 2)
+            start = time.perf_counter()
+            response = client.post("/send_message", json={
+                "sender_id": sender, "recipient_id": sender + 1, "content": "load test"
+            })
+            if response.status_code == 200:
+                local.append((time.perf_counter() - start) * 1000)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            failures[0] += failed
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(senders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Every acknowledged message must be stored and counted
+    with app.app_context():
+        stored = db.session.scalar(select(func.count(Message.id)))
+        counted = db.session.scalar(select(func.sum(UserCounters.unread_messages)))
+    assert stored == counted == len(latencies), (stored, counted, len(latencies))
+    return sorted(latencies), failures[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--senders", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--sync", choices=["normal", "full"], default="normal")
+    args = parser.parse_args()
+
+    pragmas = {**Config.SQLITE_PRAGMAS, "synchronous": args.sync.upper()}
+    modes = [("per message", 1), (f"group (<= {ProductionConfig.MESSAGE_BATCH_MAX})", ProductionConfig.MESSAGE_BATCH_MAX)]
+    print(f"{os.cpu_count()} CPUs, {pragmas}")
+    print(f"{'mode':16} {'senders':>8} {'msgs/s':>8} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for senders in args.senders:
+        for label, batch_max in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                app = build_app(os.path.join(tmp, "messages.db"), args.users, pragmas, batch_max)
+                latencies, failed = run(app, args.users, senders, args.seconds)
+                with app.app_context():
+                    db.engine.dispose()
+
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+            print(f"{label:16} {senders:8} {len(latencies) / args.seconds:8.0f} {failed:7} "
+                  f"{pct(0.5):8.1f} {pct(0.95):8.1f} {pct(0.99):8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Time /path/<a>/<b> on a synthetic family graph.
+
+Builds a SQLite database of family-shaped users (couples with children, children
+marrying into other families), loads the in-memory graph, then times random pairs
+both through FamilyGraph.shortest_path directly and through the full route.
+
+Usage (from family_backend/):
+    python benchmarks/path_search.py --users 100000 --pairs 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from sqlalchemy import insert
+from config import Config
+from models import db, User, Relationship
+from routes import main_bp
+from graph import family_graph
+
+def family_edges(users, seed):
+    """Yield (from_id, to_id, relationship_type, reverse_type) for a generated population"""
+    rng = random.Random(seed)
+    unmarried = []  # (user id, family index)
+    family = 0
+    next_id = 1
+    # Founding couples, then each generation's children marry someone from another family
+    while next_id + 1 <= users:
+        family += 1
+        a = b = None
+        if len(unmarried) >= 2 and rng.random() < 0.8:
+            a, a_family = unmarried.pop(rng.randrange(len(unmarried)))
+            b, b_family = unmarried.pop(rng.randrange(len(unmarried)))
+            if a_family == b_family:
+                unmarried.extend([(a, a_family), (b, b_family)])
+                a = b = None
+        if a is None:
+            a, b = next_id, next_id + 1
+            next_id += 2
+        yield a, b, "Spouse", "Spouse"
+
+        children = []
+        for _ in range(rng.randint(0, 4)):
+            if next_id > users:
+                break
+            child = next_id
+            next_id += 1
+            yield a, child, "Child", "Parent"
+            yield b, child, "Child", "Parent"
+            for sibling in children:
+                yield sibling, child, "Sibling", "Sibling"
+            children.append(child)
+        unmarried.extend((child, family) for child in children)
+
+def build_database(path, users, seed):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    app.register_blueprint(main_bp)
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {"id": i, "name": f"User {i}", "email": f"user{i}@example.com", "password": "x"}
+            for i in range(1, users + 1)
+        ])
+        db.session.execute(insert(Relationship), [
+            {"from_user_id": a, "to_user_id": b, "relationship_type": t, "reverse_relationship_type": r,
+             "status": "approved", "is_bidirectional": True}
+            for a, b, t, r in family_edges(users, seed)
+        ])
+        db.session.commit()
+    return app
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples), samples[int(len(samples) * 0.95) - 1], samples[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--pairs", type=int, default=500)
+    parser.add_argument("--max-hops", type=int, default=Config.PATH_MAX_HOPS)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        app = build_database(os.path.join(tmp, "bench.db"), args.users, args.seed)
+        print(f"Built {args.users} users in {time.perf_counter() - start:.1f}s")
+
+        with app.app_context():
+            start = time.perf_counter()
+            family_graph.load()
+            print(f"Loaded graph in {time.perf_counter() - start:.1f}s")
+
+            rng = random.Random(args.seed)
+            pairs = [(rng.randint(1, args.users), rng.randint(1, args.users)) for _ in range(args.pairs)]
+
+            search_ms, hops, found = [], [], 0
+            for a, b in pairs:
+                start = time.perf_counter()
+                path = family_graph.shortest_path(a, b, args.max_hops)
+                search_ms.append((time.perf_counter() - start) * 1000)
+                if path:
+                    found += 1
+                    hops.append(len(path) - 1)
+
+            client = app.test_client()
+            route_ms = []
+            for a, b in pairs:
+                start = time.perf_counter()
+                response = client.get(f"/path/{a}/{b}?max_hops={args.max_hops}")
+                route_ms.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+    print(f"{found}/{len(pairs)} pairs related within {args.max_hops} hops"
+          + (f", median {statistics.median(hops)} hops" if hops else ""))
+    print(f"{'':24} {'median':>9} {'p95':>9} {'max':>9}")
+    for label, samples in (("shortest_path (ms)", search_ms), ("GET /path (ms)", route_ms)):
+        print(f"{label:24} " + " ".join(f"{value:9.2f}" for value in percentiles(samples)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compare SQLite query plans and timings for the hot route filters before and
+after the composite indexes declared in models.py are created.
+
+Usage (from family_backend/):
+    python benchmarks/query_plans.py --messages 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import db
+
+# The filters issued by routes.py, with representative parameters
+QUERIES = [
+    ("pending requests to user",
+     "SELECT * FROM relationship WHERE to_user_id = ? AND status = 'pending'", (7,)),
+    ("pending requests from user",
+     "SELECT * FROM relationship WHERE from_user_id = ? AND status = 'pending'", (7,)),
+    ("messages between two users",
+     "SELECT * FROM message WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?) "
+     "ORDER BY timestamp", (7, 8, 8, 7)),
+    ("unread past read watermark",
+     "SELECT COUNT(*) FROM message WHERE (CASE WHEN sender_id < recipient_id THEN sender_id ELSE recipient_id END) = ? "
+     "AND (CASE WHEN sender_id < recipient_id THEN recipient_id ELSE sender_id END) = ? AND id > ? AND sender_id = ?",
+     (7, 8, 0, 8)),
+    ("pending edit requests for user",
+     "SELECT * FROM relationship_edit_request WHERE target_user_id = ? AND status = 'pending'", (7,)),
+]
+
+def create_schema(conn):
+    dialect = sqlite.dialect()
+    for table in db.metadata.sorted_tables:
+        conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+
+def create_indexes(conn):
+    dialect = sqlite.dialect()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+    conn.execute("ANALYZE")
+
+def populate(conn, users, messages, seed):
+    rng = random.Random(seed)
+    conn.executemany(
+        "INSERT INTO user (id, name, email, password) VALUES (?, ?, ?, ?)",
+        ((i, f"User {i}", f"user{i}@example.com", "x") for i in range(1, users + 1))
+    )
+    conn.executemany(
+        "INSERT INTO relationship (from_user_id, to_user_id, relationship_type, status, is_bidirectional) "
+        "VALUES (?, ?, 'Cousin', ?, 0)",
+        ((i, i + 1, rng.choice(['pending', 'approved'])) for i in range(1, users))
+    )
+    conn.executemany(
+        "INSERT INTO relationship_edit_request (relationship_id, requesting_user_id, target_user_id, "
+        "current_relationship_type, new_relationship_type, field_to_change, status) "
+        "VALUES (?, ?, ?, 'Cousin', 'Brother', 'relationship_type', 'pending')",
+        ((i, i, i + 1) for i in range(1, users))
+    )
+
+    def message_rows():
+        for i in range(messages):
+            sender = rng.randint(1, users)
+            recipient = rng.randint(1, users)
+            yield (sender, recipient, "hello", f"2025-01-01 00:{(i // 60) % 60:02d}:{i % 60:02d}")
+
+    conn.executemany(
+        "INSERT INTO message (sender_id, recipient_id, content, timestamp) VALUES (?, ?, ?, ?)",
+        message_rows()
+    )
+    conn.commit()
+
+def report(conn, label, repeat):
+    print(f"\n== {label} ==")
+    for name, sql, params in QUERIES:
+        plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        print(f"{name:32} {elapsed:9.3f} ms  {plan}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        create_schema(conn)
+        start = time.perf_counter()
+        populate(conn, args.users, args.messages, args.seed)
+        print(f"Loaded {args.users} users and {args.messages} messages in {time.perf_counter() - start:.1f}s")
+
+        report(conn, "without indexes", args.repeat)
+        start = time.perf_counter()
+        create_indexes(conn)
+        print(f"\nBuilt indexes in {time.perf_counter() - start:.1f}s")
+        report(conn, "with indexes", args.repeat)
+        conn.close()
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
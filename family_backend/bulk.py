@@ -0,0 +1,261 @@
+import csv
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Relationship, User
+from kinship import get_reverse_relationship
+from counters import adjust_counters
+from graph import family_graph
+
+CSV_FIELDS = ["from_email", "to_email", "relationship_type", "reverse_relationship_type"]
+
+# Times a chunk is re-checked and retried after another request links one of its pairs first
+IMPORT_CONFLICT_RETRIES = 3
+
+def parse_csv(lines):
+    """
+    Yield (from_email, to_email, relationship_type, reverse_relationship_type) from CSV lines.
+    The header must name from_email, to_email and relationship_type;
+    reverse_relationship_type is optional. Rows missing required values yield None.
+    """
+    for row in csv.DictReader(lines):
+        from_email = (row.get("from_email") or "").strip().lower()
+        to_email = (row.get("to_email") or "").strip().lower()
+        relationship_type = (row.get("relationship_type") or "").strip()
+        if not (from_email and to_email and relationship_type):
+            yield None
+            continue
+        yield from_email, to_email, relationship_type, (row.get("reverse_relationship_type") or "").strip() or None
+
+def _gedcom_records(lines):
+    """Group GEDCOM lines into level-0 records of (xref, tag, [(level, tag, value), ...])"""
+    record = None
+    for raw in lines:
+        parts = raw.strip().split(" ", 2)
+        if len(parts) < 2 or not parts[0].isdigit():
+            continue
+        level = int(parts[0])
+        if level == 0:
+            if record:
+                yield record
+            if parts[1].startswith("@"):
+                record = (parts[1], parts[2].strip() if len(parts) > 2 else "", [])
+            else:
+                record = None
+            continue
+        if record:
+            record[2].append((level, parts[1], parts[2].strip() if len(parts) > 2 else ""))
+    if record:
+        yield record
+
+def parse_gedcom(lines):
+    """
+    Yield relationships from a GEDCOM file: spouses, parent -> child and siblings for
+    each FAM record. Only people with an EMAIL tag can be matched to users.
+    """
+    people = {}  # xref -> (email, sex)
+    families = []
+
+    for xref, tag, fields in _gedcom_records(lines):
+        if tag == "INDI":
+            email = sex = None
+            for level, field, value in fields:
+                if level == 1 and field == "EMAIL":
+                    email = value.strip().lower()
+                elif level == 1 and field == "SEX":
+                    sex = value.strip().upper()
+            people[xref] = (email, sex)
+        elif tag == "FAM":
+            families.append((
+                [value for level, field, value in fields if level == 1 and field in ("HUSB", "WIFE")],
+                [value for level, field, value in fields if level == 1 and field == "CHIL"]
+            ))
+
+    def label(xref, male, female, neutral):
+        sex = people.get(xref, (None, None))[1]
+        return male if sex == "M" else female if sex == "F" else neutral
+
+    def email(xref):
+        return people.get(xref, (None, None))[0]
+
+    for parents, children in families:
+        if len(parents) == 2:
+            a, b = parents
+            yield email(a), email(b), label(b, "Husband", "Wife", "Spouse"), label(a, "Husband", "Wife", "Spouse")
+        for parent in parents:
+            for child in children:
+                yield email(parent), email(child), label(child, "Son", "Daughter", "Child"), \
+                    label(parent, "Father", "Mother", "Parent")
+        for i, child in enumerate(children):
+            for sibling in children[i + 1:]:
+                yield email(child), email(sibling), label(sibling, "Brother", "Sister", "Sibling"), \
+                    label(child, "Brother", "Sister", "Sibling")
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _chunk_rows(resolved, approve):
+    """
+    Relationship rows for the resolved links whose pair has no live relationship yet,
+    pending request counts per recipient, and how many links were already linked.
+    One query finds the live relationships linking any pair in the chunk.
+    """
+    ids = {user_id for link in resolved for user_id in link[:2]}
+    existing = {
+        (min(a, b), max(a, b))
+        for a, b in db.session.query(Relationship.from_user_id, Relationship.to_user_id).filter(
+            Relationship.from_user_id.in_(ids),
+            Relationship.to_user_id.in_(ids),
+            Relationship.status != 'declined'
+        )
+    }
+
+    rows = []
+    pending_by_user = {}
+    for from_id, to_id, relationship_type, reverse_type in resolved:
+        if (min(from_id, to_id), max(from_id, to_id)) in existing:
+            continue
+        approved = approve and bool(reverse_type)
+        rows.append({
+            "from_user_id": from_id,
+            "to_user_id": to_id,
+            "relationship_type": relationship_type,
+            "reverse_relationship_type": reverse_type,
+            "status": "approved" if approved else "pending",
+            "is_bidirectional": approved
+        })
+        if not approved:
+            pending_by_user[to_id] = pending_by_user.get(to_id, 0) + 1
+    return rows, pending_by_user, len(resolved) - len(rows)
+
+def import_relationships(links, approve=False, chunk_size=1000, requester_id=None):
+    """
+    Insert parsed links in chunks: each chunk resolves its emails in one query, skips
+    pairs that already have a live relationship, and inserts the rest with one
+    executemany before committing.
+
+    Links whose reverse type is known (given, or inferred by get_reverse_relationship)
+    are approved when approve is True; everything else is created as a pending request.
+    With a requester_id, only links sent by that user are imported: links to them are
+    turned around when the reverse type is known, and other links are counted as
+    not_allowed. Returns counts of what happened to each input row.
+    """
+    summary = {"created": 0, "approved": 0, "existing": 0, "unresolved": 0, "invalid": 0, "not_allowed": 0}
+    user_ids = {}  # email -> (id, gender), cached across chunks
+    seen_pairs = set()
+
+    for chunk in _chunks(links, chunk_size):
+        valid = []
+        for link in chunk:
+            if link is None or (link[0] and link[0] == link[1]):
+                summary["invalid"] += 1
+            elif not link[0] or not link[1]:
+                summary["unresolved"] += 1  # e.g. a GEDCOM person without an EMAIL
+            else:
+                valid.append(link)
+
+        missing = {email for link in valid for email in link[:2] if email not in user_ids}
+        if missing:
+            for user_id, email, gender in db.session.query(User.id, db.func.lower(User.email), User.gender).filter(
+                db.func.lower(User.email).in_(missing)
+            ):
+                user_ids[email] = (user_id, gender)
+
+        resolved = []
+        for from_email, to_email, relationship_type, reverse_type in valid:
+            if from_email not in user_ids or to_email not in user_ids:
+                summary["unresolved"] += 1
+                continue
+            (from_id, from_gender), (to_id, to_gender) = user_ids[from_email], user_ids[to_email]
+            reverse_type = reverse_type or get_reverse_relationship(relationship_type, from_gender, to_gender)
+            if requester_id is not None and from_id != requester_id:
+                if to_id != requester_id or not reverse_type:
+                    summary["not_allowed"] += 1
+                    continue
+                from_id, to_id, relationship_type, reverse_type = to_id, from_id, reverse_type, relationship_type
+            pair = (min(from_id, to_id), max(from_id, to_id))
+            if pair in seen_pairs:
+                summary["existing"] += 1
+                continue
+            seen_pairs.add(pair)
+            resolved.append((from_id, to_id, relationship_type, reverse_type))
+
+        if not resolved:
+            continue
+
+        # A concurrent /connect may link one of these pairs between the check and the
+        # insert; the unique pair index rejects the chunk, so re-check and try again
+        for attempt in range(IMPORT_CONFLICT_RETRIES + 1):
+            rows, pending_by_user, existing_count = _chunk_rows(resolved, approve)
+            try:
+                if rows:
+                    db.session.execute(insert(Relationship), rows)
+                    for user_id, count in pending_by_user.items():
+                        adjust_counters(user_id, pending_requests=count)
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == IMPORT_CONFLICT_RETRIES:
+                    raise
+        summary["existing"] += existing_count
+        summary["created"] += len(rows)
+        summary["approved"] += sum(row["status"] == "approved" for row in rows)
+        if any(row["status"] == "approved" for row in rows):
+            # Per chunk, so links committed before a later chunk fails still reach the graph
+            family_graph.invalidate()
+
+    return summary
+
+def export_tree_csv(user_id, chunk_size=500):
+    """
+    Stream the approved relationships in the user's connected family as CSV, in the
+    format import_relationships accepts. The family is found from the graph index,
+    then relationships and emails are loaded a chunk at a time.
+    """
+    yield ",".join(CSV_FIELDS) + "\r\n"
+
+    members = {user_id}
+    frontier = [user_id]
+    while frontier:
+        next_frontier = []
+        for member in frontier:
+            for other_id in family_graph.neighbour_ids(member):
+                if other_id not in members:
+                    members.add(other_id)
+                    next_frontier.append(other_id)
+        frontier = next_frontier
+
+    rel_ids = sorted({
+        rel_id for member in members for rel_id, other_id, _, _ in family_graph.neighbours(member)
+        if member < other_id
+    })
+
+    emails = {}
+    for start in range(0, len(rel_ids), chunk_size):
+        rels = Relationship.query.filter(Relationship.id.in_(rel_ids[start:start + chunk_size])).order_by(Relationship.id).all()
+        missing = {uid for rel in rels for uid in (rel.from_user_id, rel.to_user_id) if uid not in emails}
+        if missing:
+            emails.update(db.session.query(User.id, User.email).filter(User.id.in_(missing)).all())
+
+        out = _CsvLines()
+        writer = csv.writer(out)
+        for rel in rels:
+            if rel.from_user_id in emails and rel.to_user_id in emails:
+                writer.writerow([emails[rel.from_user_id], emails[rel.to_user_id],
+                                 rel.relationship_type, rel.reverse_relationship_type or ""])
+        yield "".join(out.lines)
+
+class _CsvLines:
+    """Minimal file object for csv.writer that collects written lines"""
+    def __init__(self):
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
@@ -0,0 +1,108 @@
+import hashlib
+import os
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import request, current_app, g
+from stamps import shared_state
+
+cache_stamp = shared_state.stamp("cache")
+
+# Version stamp keys: every user's list, every relationship, and one user's own data
+USERS = "users"
+RELATIONSHIPS = "relationships"
+
+def user_key(user_id):
+    return ("user", user_id)
+
+class ResponseCache:
+    """
+    In-process cache of serialized GET responses, validated by version stamps.
+
+    Write routes bump the stamps of whatever they change after committing. A cached
+    response's ETag is derived from the request path and the stamps it depends on, so
+    a poll with a matching If-None-Match is answered 304 from memory, and a repeat
+    request for an unchanged resource reuses the stored JSON body.
+
+    Stamps live in the process. With several workers, every bump is also published
+    on cache_stamp, and the other workers drop all their cached responses (see stamps.py).
+    """
+
+    def __init__(self, max_entries=1024):
+        self._lock = Lock()
+        self._versions = {}
+        self._bodies = OrderedDict()  # ETag -> JSON bytes, least recently used first
+        # Tells this process's ETags apart from another worker's or a previous run's
+        self._token = os.urandom(8).hex()
+        self.max_entries = max_entries
+
+    def bump(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
+        cache_stamp.publish()
+
+    def bump_all(self):
+        """Invalidate every cached response, for writes too broad to track"""
+        self.reset()
+        # Always published, so CLI imports reach a lone server process too
+        cache_stamp.publish(always=True)
+
+    def reset(self):
+        """Invalidate every response cached by this process"""
+        with self._lock:
+            self._token = os.urandom(8).hex()
+            self._versions.clear()
+            self._bodies.clear()
+
+    def etag(self, path, keys, viewer=None):
+        with self._lock:
+            versions = [(key, self._versions.get(key, 0)) for key in keys]
+            token = self._token
+        return hashlib.sha1(repr((token, path, viewer, versions)).encode()).hexdigest()
+
+    def get(self, etag):
+        with self._lock:
+            body = self._bodies.get(etag)
+            if body is not None:
+                self._bodies.move_to_end(etag)
+            return body
+
+    def put(self, etag, body):
+        with self._lock:
+            self._bodies[etag] = body
+            self._bodies.move_to_end(etag)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+response_cache = ResponseCache()
+cache_stamp.listeners.append(response_cache.reset)
+
+def cached_response(scope):
+    """
+    Cache a JSON GET view. scope(**view_args) returns the version stamp keys the
+    response depends on; the full path (query string included) and the signed-in
+    user are part of the key, so viewers and paging parameters get their own entries.
+    Only 200 responses are stored.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            etag = response_cache.etag(request.full_path, scope(**view_args), g.get("user_id"))
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+            else:
+                body = response_cache.get(etag)
+                if body is None:
+                    response = current_app.make_response(view(**view_args))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.put(etag, response.get_data())
+                else:
+                    response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            # Clients may keep the body but must check back before reusing it
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -1,4 +1,148 @@
+import os
+
+def database_url(name, default=None):
+    """Read a database URL from the environment, accepting the postgres:// scheme some hosts use"""
+    url = os.environ.get(name, default)
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///family.db'
+    # SQLite by default; set DATABASE_URL to a postgresql:// URL to use PostgreSQL
+    SQLALCHEMY_DATABASE_URI = database_url('DATABASE_URL', 'sqlite:///family.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = 'dev-key'
+    DEBUG = False
+
+    # Optional read replica: routes marked replica_read send their queries there (database.py).
+    # Reads stay on the primary for a short while after this process writes, to cover replica lag.
+    SQLALCHEMY_BINDS = {'replica': database_url('DATABASE_REPLICA_URL')} if os.environ.get('DATABASE_REPLICA_URL') else {}
+    REPLICA_READ_AFTER_WRITE_SECONDS = 2
+
+    # Applied to every new SQLite connection. WAL lets readers keep going while a writer
+    # commits; NORMAL sync is durable across app crashes and only risks the last commits
+    # on power loss; busy_timeout (ms) makes writers wait for the lock instead of failing.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+    }
+
+    # Keep each worker's family graph and caches in step with writes made by other workers
+    # (stamps.py): writes publish a version row, and workers check it every few seconds.
+    # On by default when gunicorn runs several workers; with one, only CLI imports publish.
+    SHARED_STATE_SYNC = int(os.environ.get('WEB_CONCURRENCY', 1)) > 1 or \
+        os.environ.get('SHARED_STATE_SYNC', '').lower() in ('1', 'true')
+    SHARED_STATE_CHECK_SECONDS = 1
+
+    # Password hashing: werkzeug method string (changing it rehashes each user's password
+    # at their next login), pool processes (0 hashes on the request thread), how many hashes
+    # may be queued before logins get 503, and seconds to wait for a result
+    PASSWORD_HASH_METHOD = "scrypt:32768:8:1"
+    PASSWORD_HASH_WORKERS = 2
+    PASSWORD_HASH_MAX_PENDING = 32
+    PASSWORD_HASH_TIMEOUT = 10
+
+    # Session tokens from /auth/login: lifetime in seconds, tokens resolved per process, and
+    # seconds a resolved token is trusted before the user_session table is checked again
+    # (how long a logout takes to reach other workers). With AUTH_REQUIRED off, requests
+    # without a token may still name the acting user in the URL or body; it is on in production.
+    # STREAM_TICKET_MAX_AGE is how long an /events ticket from /auth/stream_ticket stays valid.
+    SESSION_MAX_AGE = 30 * 24 * 3600
+    SESSION_CACHE_SIZE = 10000
+    SESSION_CACHE_TTL = 60
+    AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '').lower() in ('1', 'true')
+    STREAM_TICKET_MAX_AGE = 30
+
+    # send_message group commit: most messages per transaction, seconds the writer waits
+    # for more once one arrives, messages allowed to queue before senders get 503, and
+    # seconds a sender waits for its commit. MESSAGE_BATCH_MAX = 1 writes on the request thread.
+    # With no wait, a batch is whatever queued up during the previous commit, which keeps a
+    # lone sender as fast as before (benchmarks/message_throughput.py); a few ms can pay
+    # off where every commit is a slow fsync.
+    MESSAGE_BATCH_MAX = 64
+    MESSAGE_BATCH_WAIT = 0
+    MESSAGE_BATCH_MAX_PENDING = 1024
+    MESSAGE_BATCH_TIMEOUT = 10
+
+    # Upper bounds for /tree/<user_id>; clients may ask for less via query params
+    TREE_MAX_DEPTH = 50
+    TREE_MAX_NODES = 5000
+
+    # Upper bounds for /kinship and /extended_family walks; clients may ask for a smaller degree
+    KINSHIP_MAX_DEGREE = 6
+    KINSHIP_NODE_BUDGET = 5000
+
+    # Longest chain /path/<a>/<b> will search for
+    PATH_MAX_HOPS = 12
+
+    # Largest page /users/search will return
+    USER_SEARCH_MAX_LIMIT = 100
+
+    # Largest page /messages/search/<user_id> will return
+    MESSAGE_SEARCH_MAX_LIMIT = 50
+
+    # Default and largest page sizes for /messages/<user_id>/<other_user_id>
+    MESSAGE_PAGE_SIZE = 50
+    MESSAGE_PAGE_MAX = 200
+
+    # Default and largest page sizes for /conversations/<user_id>
+    CONVERSATION_PAGE_SIZE = 30
+    CONVERSATION_PAGE_MAX = 100
+
+    # `flask archive-messages` moves read messages older than this many days into
+    # compressed per-conversation segments of up to MESSAGE_ARCHIVE_SEGMENT_SIZE messages
+    MESSAGE_ARCHIVE_AFTER_DAYS = 180
+    MESSAGE_ARCHIVE_SEGMENT_SIZE = 200
+
+    # Opt-in request profiling (profiling.py): times every SQL statement, adds X-Query-Count
+    # to responses and serves per-route totals at /metrics, keeping each route's
+    # PROFILING_SLOW_STATEMENTS slowest statements
+    PROFILING = os.environ.get('PROFILING', '').lower() in ('1', 'true')
+    PROFILING_SLOW_STATEMENTS = 5
+
+    # Seconds between keep-alive comments on idle /events streams, and the most streams one
+    # process keeps open (each holds a thread; gunicorn.conf.py adds this many threads)
+    EVENT_STREAM_HEARTBEAT_SECONDS = 15
+    EVENT_STREAM_MAX = int(os.environ.get('EVENT_STREAM_MAX', 64))
+
+    # Relationships inserted per transaction by bulk imports
+    IMPORT_CHUNK_SIZE = 1000
+
+    # Precomputed profile projections kept per process, and the largest /profiles batch
+    PROFILE_CACHE_SIZE = 10000
+    PROFILE_BATCH_MAX = 100
+
+    # Serialized GET responses kept for ETag revalidation (per process)
+    RESPONSE_CACHE_SIZE = 1024
+
+    # Uploaded profile pictures; AVATAR_DIR defaults to <instance>/avatars
+    AVATAR_DIR = None
+    AVATAR_MAX_BYTES = 5 * 1024 * 1024
+    AVATAR_CACHE_SECONDS = 365 * 24 * 3600
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    # Pool processes would each re-import app.py under `python app.py`, so hash inline
+    PASSWORD_HASH_WORKERS = 0
+
+class ProductionConfig(Config):
+    # Signs session tokens and stream tickets; app.py refuses to start without one
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Never trust client-supplied user ids in production unless explicitly turned off
+    AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '1').lower() in ('1', 'true')
+
+    # One pooled connection per server thread (see gunicorn.conf.py), with a little headroom
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 16)),
+        "max_overflow": 4,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
+
+# Selected with the APP_ENV environment variable
+config_by_name = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
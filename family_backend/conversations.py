@@ -0,0 +1,118 @@
+from collections import Counter
+from sqlalchemy import or_, and_
+from models import db, ConversationSummary, Message, unordered_pair
+
+def record_messages(messages):
+    """
+    Update both participants' summaries for new messages, e.g. one group-committed batch.
+    Call after the messages have been flushed (so they have ids) and before commit.
+    """
+    last_ids = {}
+    unread = Counter()
+    for message in messages:
+        for key in ((message.sender_id, message.recipient_id), (message.recipient_id, message.sender_id)):
+            last_ids[key] = max(last_ids.get(key, 0), message.id)
+        unread[(message.recipient_id, message.sender_id)] += 1
+
+    summaries = {
+        (summary.user_id, summary.partner_id): summary
+        for summary in ConversationSummary.query.filter(or_(*(
+            and_(ConversationSummary.user_id == user_id, ConversationSummary.partner_id == partner_id)
+            for user_id, partner_id in last_ids
+        )))
+    }
+    # Same row order in every transaction, so concurrent writers can't deadlock
+    for key in sorted(last_ids):
+        summary = summaries.get(key)
+        if summary is None:
+            db.session.add(ConversationSummary(
+                user_id=key[0], partner_id=key[1], last_message_id=last_ids[key],
+                unread_count=unread[key], last_read_message_id=0
+            ))
+            continue
+        summary.last_message_id = last_ids[key]
+        if unread[key]:
+            # Incremented in SQL so concurrent senders don't lose updates
+            summary.unread_count = ConversationSummary.unread_count + unread[key]
+
+def mark_read(user_id, partner_id, up_to_id=None):
+    """
+    Move user_id's read watermark for partner_id up to up_to_id (default: the latest
+    message) and return (messages newly read, watermark). However many messages that
+    covers, only the summary row is written; caller adjusts the badge counter and commits.
+    """
+    summary = ConversationSummary.query.filter_by(user_id=user_id, partner_id=partner_id).first()
+    if summary is None:
+        return 0, 0
+    watermark = summary.last_read_message_id
+    target = summary.last_message_id if up_to_id is None else min(up_to_id, summary.last_message_id)
+    if target <= watermark:
+        return 0, watermark
+
+    # Counted over the (pair, id) index; only the partner's messages can be unread
+    low, high = unordered_pair(Message.sender_id, Message.recipient_id)
+    marked = db.session.query(db.func.count(Message.id)).filter(
+        low == min(user_id, partner_id), high == max(user_id, partner_id),
+        Message.id > watermark, Message.id <= target, Message.sender_id == partner_id
+    ).scalar()
+    # Only moves from the watermark we counted from, so concurrent marks can't both subtract
+    moved = ConversationSummary.query.filter_by(id=summary.id, last_read_message_id=watermark).update({
+        ConversationSummary.last_read_message_id: target,
+        ConversationSummary.unread_count: ConversationSummary.unread_count - marked
+    }, synchronize_session=False)
+    if not moved:
+        return 0, watermark
+    return marked, target
+
+def read_watermarks(user_a, user_b):
+    """{user_id: last read message id} for both sides of a conversation"""
+    return dict(db.session.query(ConversationSummary.user_id, ConversationSummary.last_read_message_id).filter(or_(
+        and_(ConversationSummary.user_id == user_a, ConversationSummary.partner_id == user_b),
+        and_(ConversationSummary.user_id == user_b, ConversationSummary.partner_id == user_a)
+    )))
+
+def unread_by_conversation():
+    """(user_id, partner_id, count) of the partner's messages past each user's read watermark"""
+    return db.session.query(
+        ConversationSummary.user_id, ConversationSummary.partner_id, db.func.count(Message.id)
+    ).join(Message, and_(
+        Message.recipient_id == ConversationSummary.user_id,
+        Message.sender_id == ConversationSummary.partner_id,
+        Message.id > ConversationSummary.last_read_message_id
+    )).group_by(ConversationSummary.user_id, ConversationSummary.partner_id)
+
+def delete_user_conversations(user_id):
+    ConversationSummary.query.filter(
+        or_(ConversationSummary.user_id == user_id, ConversationSummary.partner_id == user_id)
+    ).delete(synchronize_session=False)
+
+def rebuild_conversation_summaries():
+    """Recompute every summary from the message table (backfill and repair), keeping read watermarks"""
+    watermarks = {
+        (user_id, partner_id): last_read_id for user_id, partner_id, last_read_id in db.session.query(
+            ConversationSummary.user_id, ConversationSummary.partner_id, ConversationSummary.last_read_message_id
+        )
+    }
+    unread = {(user_id, partner_id): count for user_id, partner_id, count in unread_by_conversation()}
+    ConversationSummary.query.delete(synchronize_session=False)
+
+    last_ids = {}
+    for sender_id, recipient_id, last_id in db.session.query(
+        Message.sender_id, Message.recipient_id, db.func.max(Message.id)
+    ).group_by(Message.sender_id, Message.recipient_id):
+        for key in ((sender_id, recipient_id), (recipient_id, sender_id)):
+            last_ids[key] = max(last_ids.get(key, 0), last_id)
+
+    db.session.bulk_insert_mappings(ConversationSummary, [
+        {
+            "user_id": user_id,
+            "partner_id": partner_id,
+            "last_message_id": last_id,
+            "unread_count": unread.get((user_id, partner_id), 0),
+            # A conversation with no summary yet counts as read
+            "last_read_message_id": watermarks.get((user_id, partner_id), last_id)
+        }
+        for (user_id, partner_id), last_id in last_ids.items()
+    ])
+    db.session.commit()
+    return len(last_ids)
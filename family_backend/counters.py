@@ -0,0 +1,55 @@
+from models import db, Relationship, RelationshipEditRequest, UserCounters
+from conversations import unread_by_conversation
+
+COUNTER_FIELDS = ("unread_messages", "pending_requests", "pending_edit_requests")
+
+def adjust_counters(user_id, **deltas):
+    """
+    Add deltas to a user's counters, e.g. adjust_counters(2, unread_messages=1).
+    Increments are applied in SQL so concurrent writers don't lose updates; caller commits.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    updated = UserCounters.query.filter_by(user_id=user_id).update(
+        {getattr(UserCounters, field): getattr(UserCounters, field) + delta for field, delta in deltas.items()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(UserCounters(
+            user_id=user_id,
+            **{field: max(deltas.get(field, 0), 0) for field in COUNTER_FIELDS}
+        ))
+
+def get_badges(user_id):
+    counters = db.session.get(UserCounters, user_id)
+    if counters is None:
+        return {field: 0 for field in COUNTER_FIELDS}
+    # Clamp in case a repair is overdue
+    return {field: max(getattr(counters, field), 0) for field in COUNTER_FIELDS}
+
+def repair_counters():
+    """Recompute every user's counters from the underlying tables"""
+    totals = {}
+
+    def add(rows, field):
+        for user_id, count in rows:
+            totals.setdefault(user_id, dict.fromkeys(COUNTER_FIELDS, 0))[field] = count
+
+    unread = {}
+    for user_id, _, count in unread_by_conversation():
+        unread[user_id] = unread.get(user_id, 0) + count
+    add(unread.items(), "unread_messages")
+    add(db.session.query(Relationship.to_user_id, db.func.count(Relationship.id))
+        .filter(Relationship.status == 'pending').group_by(Relationship.to_user_id), "pending_requests")
+    add(db.session.query(RelationshipEditRequest.target_user_id, db.func.count(RelationshipEditRequest.id))
+        .filter(RelationshipEditRequest.status == 'pending').group_by(RelationshipEditRequest.target_user_id),
+        "pending_edit_requests")
+
+    UserCounters.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(UserCounters, [
+        dict(user_id=user_id, **counts) for user_id, counts in totals.items()
+    ])
+    db.session.commit()
+    return len(totals)
@@ -0,0 +1,71 @@
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = "replica"
+
+def configure_sqlite(engine, pragmas):
+    """Run the configured PRAGMAs on every new connection to a SQLite engine"""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+class RoutingSession(Session):
+    """
+    Session that sends reads from replica_read views to the "replica" bind, when one
+    is configured, and everything else to the primary.
+
+    A replica may lag behind the primary, so for REPLICA_READ_AFTER_WRITE_SECONDS after
+    this process commits a write, reads stay on the primary too. That keeps a client's
+    next poll from missing its own change and stops the response caches from storing
+    an old answer under a new version stamp.
+    """
+    last_write = 0.0  # time.monotonic() of the last committed write in this process
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica():
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self):
+        if not has_app_context() or not g.get("replica_read") or self.info.get("wrote"):
+            return False
+        if REPLICA_BIND not in self._db.engines:
+            return False
+        window = current_app.config["REPLICA_READ_AFTER_WRITE_SECONDS"]
+        return time.monotonic() - RoutingSession.last_write >= window
+
+@event.listens_for(RoutingSession, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _executed(orm_execute_state):
+    # Bulk insert() / query.update() / query.delete() don't go through a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _committed(session):
+    if session.info.pop("wrote", False):
+        RoutingSession.last_write = time.monotonic()
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+def replica_read(view):
+    """Mark a view as read-only, so its queries may be served by the replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_read = True
+        return view(*args, **kwargs)
+    return wrapper
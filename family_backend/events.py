@@ -0,0 +1,83 @@
+import json
+import queue
+from itertools import count
+from threading import Lock
+
+class EventHub:
+    """
+    In-process publish/subscribe hub for server-sent events.
+
+    Each open /events stream registers a bounded queue for its user; write routes
+    publish small deltas to the users they affect after committing. A subscriber
+    that stops reading has its oldest events dropped rather than blocking writers.
+    Events only reach streams held by the same process.
+    """
+
+    def __init__(self, queue_size=100):
+        self._lock = Lock()
+        self._subscribers = {}  # user id -> set of queues
+        self._streams = 0
+        self._ids = count(1)
+        self.queue_size = queue_size
+
+    def subscribe(self, user_id, max_streams=None):
+        """A new queue for user_id's events, or None if max_streams are already open"""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if max_streams is not None and self._streams >= max_streams:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(q)
+            self._streams += 1
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            queues = self._subscribers.get(user_id)
+            if queues and q in queues:
+                queues.discard(q)
+                self._streams -= 1
+                if not queues:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            queues = list(self._subscribers.get(user_id, ()))
+            event_id = next(self._ids)
+        event = (event_id, event_type, data)
+        for q in queues:
+            while True:
+                try:
+                    q.put_nowait(event)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def subscriber_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(queues) for queues in self._subscribers.values())
+
+def format_sse(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+def stream_events(q, heartbeat_seconds):
+    """
+    Generator yielding SSE frames from a subscribed queue until the client disconnects.
+    The caller unsubscribes when the response closes, which also covers a stream that
+    is dropped before its first frame.
+    """
+    yield "retry: 5000\n\n"
+    while True:
+        try:
+            event = q.get(timeout=heartbeat_seconds)
+        except queue.Empty:
+            # Comment line keeps proxies from closing an idle stream
+            yield ": keep-alive\n\n"
+            continue
+        yield format_sse(*event)
+
+event_hub = EventHub()
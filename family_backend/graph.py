@@ -0,0 +1,291 @@
+from collections import OrderedDict
+from threading import RLock
+from sqlalchemy import select
+from models import db, Relationship
+from kinship import compose_relationships
+from stamps import shared_state
+
+graph_stamp = shared_state.stamp("graph")
+
+class FamilyGraph:
+    """
+    Process-level adjacency index of approved, bidirectional relationships.
+
+    Maps user id -> neighbour id -> relationship id -> (my_type, their_type), where
+    my_type is what the user calls the neighbour. The index is loaded from the
+    database on first use and then kept current by the write routes, so
+    connectivity checks are dictionary lookups rather than queries.
+
+    Each process holds its own copy. Changes are published on graph_stamp, so other
+    server workers drop theirs and reload within SHARED_STATE_CHECK_SECONDS (see stamps.py).
+
+    Breadth-first walks used for derived kinship are cached per (user, limits) and
+    discarded whenever the graph changes.
+    """
+
+    def __init__(self, walk_cache_size=256):
+        self._lock = RLock()
+        self._adjacency = {}
+        self._edges = {}  # relationship id -> (from_user_id, to_user_id)
+        self._loaded = False
+        self._walk_cache = OrderedDict()
+        self.walk_cache_size = walk_cache_size
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def load(self):
+        """(Re)build the index from the relationship table"""
+        # Read the stamp first, so a change committed during the load still triggers a reload
+        graph_stamp.sync()
+        # Always read the primary: a lagging replica would leave the index stale until restart
+        with db.engine.connect() as connection:
+            rows = connection.execute(select(
+                Relationship.id,
+                Relationship.from_user_id,
+                Relationship.to_user_id,
+                Relationship.relationship_type,
+                Relationship.reverse_relationship_type
+            ).where(
+                (Relationship.status == 'approved') &
+                (Relationship.is_bidirectional == True)
+            )).all()
+
+        self.load_edges(rows)
+
+    def load_edges(self, rows):
+        """Replace the index with (rel_id, from_id, to_id, rel_type, reverse_type) rows"""
+        with self._lock:
+            self._adjacency = {}
+            self._edges = {}
+            for rel_id, from_id, to_id, rel_type, reverse_type in rows:
+                self._link(rel_id, from_id, to_id, rel_type, reverse_type)
+            self._loaded = True
+            self._changed()
+
+    def invalidate(self):
+        """Drop the index here and in every other process; it is rebuilt on next use"""
+        self.drop()
+        graph_stamp.publish(always=True)
+
+    def drop(self):
+        """Drop this process's index, e.g. after another process changed relationships"""
+        with self._lock:
+            self._adjacency = {}
+            self._edges = {}
+            self._loaded = False
+            self._changed()
+
+    def _changed(self):
+        # Any edge change can alter every cached walk, so drop them all
+        self._walk_cache.clear()
+
+    def _link(self, rel_id, from_id, to_id, rel_type, reverse_type):
+        self._adjacency.setdefault(from_id, {}).setdefault(to_id, {})[rel_id] = (rel_type, reverse_type)
+        self._adjacency.setdefault(to_id, {}).setdefault(from_id, {})[rel_id] = (reverse_type, rel_type)
+        self._edges[rel_id] = (from_id, to_id)
+        self._changed()
+
+    def _unlink(self, rel_id):
+        endpoints = self._edges.pop(rel_id, None)
+        if endpoints is None:
+            return
+        self._changed()
+        for a, b in (endpoints, endpoints[::-1]):
+            neighbours = self._adjacency.get(a, {})
+            links = neighbours.get(b, {})
+            links.pop(rel_id, None)
+            if not links:
+                neighbours.pop(b, None)
+            if not neighbours:
+                self._adjacency.pop(a, None)
+
+    def update(self, rel):
+        """Apply the committed state of a Relationship row to the index"""
+        with self._lock:
+            if self._loaded:  # Otherwise the next load will read it from the database
+                self._unlink(rel.id)
+                if rel.status == 'approved' and rel.is_bidirectional:
+                    self._link(rel.id, rel.from_user_id, rel.to_user_id,
+                               rel.relationship_type, rel.reverse_relationship_type)
+        graph_stamp.publish()
+
+    def remove(self, rel_id):
+        with self._lock:
+            self._unlink(rel_id)
+        graph_stamp.publish()
+
+    def remove_user(self, user_id):
+        with self._lock:
+            for links in list(self._adjacency.get(user_id, {}).values()):
+                for rel_id in list(links):
+                    self._unlink(rel_id)
+        graph_stamp.publish()
+
+    def are_connected(self, user_a, user_b):
+        with self._lock:
+            self._ensure_loaded()
+            return user_b in self._adjacency.get(user_a, {})
+
+    def neighbours(self, user_id):
+        """List (relationship_id, other_user_id, my_type, their_type) for a user"""
+        with self._lock:
+            self._ensure_loaded()
+            return [
+                (rel_id, other_id, my_type, their_type)
+                for other_id, links in self._adjacency.get(user_id, {}).items()
+                for rel_id, (my_type, their_type) in links.items()
+            ]
+
+    def neighbour_ids(self, user_id):
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._adjacency.get(user_id, {}))
+
+    def walk(self, user_id, max_degree, max_nodes):
+        """
+        Breadth-first walk from user_id over approved relationships, at most max_degree
+        hops and max_nodes relatives. Returns (relatives, truncated) where relatives maps
+        user id -> {"degree", "parent", "label", "relationship"}: label is what the parent
+        on the shortest path calls them, and relationship is what user_id calls them,
+        composed along that path (None if it can't be named).
+        """
+        key = (user_id, max_degree, max_nodes)
+        with self._lock:
+            self._ensure_loaded()
+            cached = self._walk_cache.get(key)
+            if cached is not None:
+                self._walk_cache.move_to_end(key)
+                return cached
+
+            result = self._walk(user_id, max_degree, max_nodes)
+            self._walk_cache[key] = result
+            if len(self._walk_cache) > self.walk_cache_size:
+                self._walk_cache.popitem(last=False)
+            return result
+
+    def _walk(self, user_id, max_degree, max_nodes):
+        relatives = {}
+        frontier = [user_id]
+        truncated = False
+
+        for degree in range(1, max_degree + 1):
+            next_frontier = []
+            for member in frontier:
+                implied = relatives[member]["relationship"] if member != user_id else None
+                for other_id in self._adjacency.get(member, {}):
+                    if other_id == user_id:
+                        continue
+                    my_type = self.label(member, other_id)
+                    relationship = my_type if member == user_id else (
+                        compose_relationships(implied, my_type) if implied else None
+                    )
+                    existing = relatives.get(other_id)
+                    if existing:
+                        # Same distance by another route: keep the first path that can be named
+                        if existing["degree"] == degree and existing["relationship"] is None and relationship:
+                            existing.update(parent=member, label=my_type, relationship=relationship)
+                        continue
+                    if len(relatives) >= max_nodes:
+                        truncated = True
+                        continue
+                    relatives[other_id] = {
+                        "degree": degree, "parent": member, "label": my_type, "relationship": relationship
+                    }
+                    next_frontier.append(other_id)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        else:
+            # Stopped by max_degree; anything beyond the last frontier is unexplored
+            truncated = truncated or any(
+                other_id not in relatives and other_id != user_id
+                for member in frontier for other_id in self._adjacency.get(member, {})
+            )
+
+        return relatives, truncated
+
+    def path_from_walk(self, relatives, user_id, target_id):
+        """[(user_id, None), (next_id, label), ...] from a walk result, or None if unreached"""
+        if target_id not in relatives:
+            return None
+        path = []
+        node = target_id
+        while node != user_id:
+            entry = relatives[node]
+            path.append((node, entry["label"]))
+            node = entry["parent"]
+        path.append((user_id, None))
+        return path[::-1]
+
+    def label(self, user_id, other_id):
+        """What user_id calls other_id (their oldest link if there are several)"""
+        return self._adjacency[user_id][other_id][min(self._adjacency[user_id][other_id])][0]
+
+    def shortest_path(self, user_a, user_b, max_hops):
+        """
+        Bidirectional breadth-first search between two users, at most max_hops long.
+        Returns [(user_a, None), (next_id, label), ..., (user_b, label)] where each label
+        is what the previous user calls the next, or None if there's no such path.
+
+        Each round expands whole levels of the smaller frontier, so the work done is
+        roughly the size of both neighbourhoods at half the distance rather than the
+        full neighbourhood of user_a.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if user_a == user_b:
+                return [(user_a, None)]
+
+            # node -> (parent, depth) for each side of the search
+            seen_a = {user_a: (None, 0)}
+            seen_b = {user_b: (None, 0)}
+            frontier_a, frontier_b = [user_a], [user_b]
+            hops = 0
+
+            while frontier_a and frontier_b and hops < max_hops:
+                if len(frontier_a) <= len(frontier_b):
+                    frontier_a, meeting = self._expand(frontier_a, seen_a, seen_b)
+                else:
+                    frontier_b, meeting = self._expand(frontier_b, seen_b, seen_a)
+                hops += 1
+                if meeting is not None:
+                    return self._join(meeting, seen_a, seen_b)
+            return None
+
+    def _expand(self, frontier, seen, other_seen):
+        """Advance one side by a full level; return (next frontier, best meeting node)"""
+        next_frontier = []
+        meeting = None
+        best = None
+        for member in frontier:
+            depth = seen[member][1] + 1
+            for other_id in self._adjacency.get(member, {}):
+                if other_id in seen:
+                    continue
+                seen[other_id] = (member, depth)
+                next_frontier.append(other_id)
+                if other_id in other_seen:
+                    total = depth + other_seen[other_id][1]
+                    if best is None or total < best:
+                        meeting, best = other_id, total
+        return next_frontier, meeting
+
+    def _join(self, meeting, seen_a, seen_b):
+        nodes = []
+        node = meeting
+        while node is not None:
+            nodes.append(node)
+            node = seen_a[node][0]
+        nodes.reverse()
+        node = seen_b[meeting][0]
+        while node is not None:
+            nodes.append(node)
+            node = seen_b[node][0]
+        return [(nodes[0], None)] + [
+            (nodes[i], self.label(nodes[i - 1], nodes[i])) for i in range(1, len(nodes))
+        ]
+
+family_graph = FamilyGraph()
+graph_stamp.listeners.append(family_graph.drop)
@@ -0,0 +1,26 @@
+# Settings for `gunicorn -c gunicorn.conf.py wsgi:app`
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+# The family graph and response/profile caches live in each worker's memory. With more
+# than one worker, SHARED_STATE_SYNC (on when WEB_CONCURRENCY > 1) publishes every write
+# through the change_stamp table, and the other workers reload within
+# SHARED_STATE_CHECK_SECONDS. /events is not shared: a stream only receives events for
+# writes handled by its own worker, so with several workers clients can miss live
+# updates until they next fetch. One worker with many threads is the default.
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = "gthread"
+# GUNICORN_THREADS serve ordinary requests; keep DB_POOL_SIZE in line with it. Each open
+# /events stream holds a thread of its own (but no database connection), so the worker
+# gets EVENT_STREAM_MAX more, and /events answers 503 beyond that rather than letting
+# streams take the threads other requests need.
+threads = int(os.environ.get("GUNICORN_THREADS", 16)) + int(os.environ.get("EVENT_STREAM_MAX", 64))
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+# The default format logs the query string; log the path only, so /events tickets and
+# search queries stay out of the logs
+access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(m)s %(U)s %(H)s" %(s)s %(b)s "%(f)s" "%(a)s"'
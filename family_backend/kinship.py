@@ -0,0 +1,146 @@
+import re
+
+# Kinship kinds and the words used for each: (male, female, unspecified)
+KINSHIP_LABELS = {
+    "parent": ("Father", "Mother", "Parent"),
+    "child": ("Son", "Daughter", "Child"),
+    "sibling": ("Brother", "Sister", "Sibling"),
+    "spouse": ("Husband", "Wife", "Spouse"),
+    "grandparent": ("Grandfather", "Grandmother", "Grandparent"),
+    "grandchild": ("Grandson", "Granddaughter", "Grandchild"),
+    "great-grandparent": ("Great-grandfather", "Great-grandmother", "Great-grandparent"),
+    "great-grandchild": ("Great-grandson", "Great-granddaughter", "Great-grandchild"),
+    "pibling": ("Uncle", "Aunt", "Pibling"),
+    "nibling": ("Nephew", "Niece", "Nibling"),
+    "great-pibling": ("Great-uncle", "Great-aunt", "Great-pibling"),
+    "great-nibling": ("Great-nephew", "Great-niece", "Great-nibling"),
+    "cousin": ("Cousin", "Cousin", "Cousin"),
+    "parent-in-law": ("Father-in-law", "Mother-in-law", "Parent-in-law"),
+    "child-in-law": ("Son-in-law", "Daughter-in-law", "Child-in-law"),
+    "sibling-in-law": ("Brother-in-law", "Sister-in-law", "Sibling-in-law"),
+    "step-parent": ("Stepfather", "Stepmother", "Step-parent"),
+    "step-child": ("Stepson", "Stepdaughter", "Stepchild"),
+    "step-sibling": ("Stepbrother", "Stepsister", "Step-sibling"),
+    "half-sibling": ("Half-brother", "Half-sister", "Half-sibling"),
+}
+
+# Other words people use for the same kinds
+KINSHIP_ALIASES = {
+    "Dad": ("parent", "male"),
+    "Mum": ("parent", "female"),
+    "Mom": ("parent", "female"),
+    "Grandpa": ("grandparent", "male"),
+    "Grandma": ("grandparent", "female"),
+    "Partner": ("spouse", None),
+}
+
+# If A calls B <kind>, B calls A <inverse kind>
+INVERSE_KINDS = {
+    "parent": "child",
+    "grandparent": "grandchild",
+    "great-grandparent": "great-grandchild",
+    "pibling": "nibling",
+    "great-pibling": "great-nibling",
+    "parent-in-law": "child-in-law",
+    "step-parent": "step-child",
+    "sibling": "sibling",
+    "spouse": "spouse",
+    "cousin": "cousin",
+    "sibling-in-law": "sibling-in-law",
+    "step-sibling": "step-sibling",
+    "half-sibling": "half-sibling",
+}
+INVERSE_KINDS.update({inverse: kind for kind, inverse in list(INVERSE_KINDS.items())})
+
+# If A calls B <first> and B calls C <second>, A calls C <result>.
+# Only unambiguous compositions are listed (a parent's child may be a sibling or oneself,
+# a parent's spouse may be a parent or a step-parent, and a "Brother" may be a half- or
+# step-brother, so his parent or sibling needn't be ours), so anything else is left unnamed.
+COMPOSED_KINDS = {
+    ("parent", "parent"): "grandparent",
+    ("parent", "sibling"): "pibling",
+    ("parent", "grandparent"): "great-grandparent",
+    ("grandparent", "parent"): "great-grandparent",
+    ("child", "child"): "grandchild",
+    ("child", "grandchild"): "great-grandchild",
+    ("grandchild", "child"): "great-grandchild",
+    ("child", "spouse"): "child-in-law",
+    ("sibling", "child"): "nibling",
+    ("sibling", "spouse"): "sibling-in-law",
+    ("sibling", "grandchild"): "great-nibling",
+    ("spouse", "parent"): "parent-in-law",
+    ("spouse", "sibling"): "sibling-in-law",
+    ("pibling", "child"): "cousin",
+    ("pibling", "spouse"): "pibling",
+    ("grandparent", "sibling"): "great-pibling",
+    ("cousin", "sibling"): "cousin",
+}
+
+SEXES = ("male", "female", None)
+
+def _normalise(term):
+    return re.sub(r"[\s_\-]", "", term or "").lower()
+
+def _build_lookups():
+    terms = {}
+    for kind, labels in KINSHIP_LABELS.items():
+        for sex, label in zip(SEXES, labels):
+            # "Cousin" covers every sex, so the unspecified entry wins
+            if _normalise(label) not in terms or sex is None:
+                terms[_normalise(label)] = (kind, sex)
+    for alias, kind_sex in KINSHIP_ALIASES.items():
+        terms[_normalise(alias)] = kind_sex
+
+    reverse = {}
+    for term, (kind, _) in terms.items():
+        inverse = INVERSE_KINDS.get(kind)
+        if inverse:
+            for sex in SEXES:
+                reverse[(term, sex)] = label_for(inverse, sex)
+    return terms, reverse
+
+def label_for(kind, sex):
+    male, female, neutral = KINSHIP_LABELS[kind]
+    return male if sex == "male" else female if sex == "female" else neutral
+
+def parse_term(relationship):
+    """(kind, sex) for a relationship word, or None if it isn't a known kinship term"""
+    return KINSHIP_TERMS.get(_normalise(relationship))
+
+def get_reverse_relationship(original_relationship, sender_gender, receiver_gender=None):
+    """
+    Determine the reverse relationship based on the original relationship and genders.
+    Returns the suggested relationship from receiver to sender.
+
+    Example: If sender says receiver is their "Son",
+    then receiver should call sender their "Father" or "Mother" (based on sender's gender)
+    """
+    # Unknown sender genders keep the historical default of the male term
+    sex = "female" if sender_gender == "female" else "male"
+    return REVERSE_LOOKUP.get((_normalise(original_relationship), sex))
+
+def compose_relationships(first, second):
+    """
+    If A calls B `first` and B calls C `second`, return what A calls C
+    (e.g. "Father" + "Brother" -> "Uncle"), or None when it can't be named.
+    """
+    a = parse_term(first)
+    b = parse_term(second)
+    if not a or not b:
+        return None
+    kind = COMPOSED_KINDS.get((a[0], b[0]))
+    return label_for(kind, b[1]) if kind else None
+
+def compose_path(labels):
+    """Fold compose_relationships over a chain of labels; None once any step can't be named"""
+    labels = list(labels)
+    if not labels:
+        return None
+    result = labels[0]
+    for label in labels[1:]:
+        result = compose_relationships(result, label)
+        if result is None:
+            return None
+    return result
+
+KINSHIP_TERMS, REVERSE_LOOKUP = _build_lookups()
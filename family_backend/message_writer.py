@@ -0,0 +1,142 @@
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from models import db, Message
+from conversations import record_messages
+from counters import adjust_counters
+
+# What send_message needs of a committed message, read before the commit expires it
+SentMessage = namedtuple("SentMessage", "id sender_id recipient_id content timestamp")
+
+class WriterBusy(Exception):
+    """The message was not written (too many are waiting, or it waited too long); the caller should retry later"""
+
+class WriterTimeout(Exception):
+    """The message was being written when the caller stopped waiting; it may or may not have been committed"""
+
+def write_messages(items):
+    """
+    Insert (sender_id, recipient_id, content) messages with their conversation summary
+    and badge counter updates, and commit them in one transaction.
+    """
+    messages = [Message(sender_id=sender_id, recipient_id=recipient_id, content=content)
+                for sender_id, recipient_id, content in items]
+    db.session.add_all(messages)
+    db.session.flush()
+    record_messages(messages)
+    unread = Counter(message.recipient_id for message in messages)
+    for recipient_id in sorted(unread):
+        adjust_counters(recipient_id, unread_messages=unread[recipient_id])
+    sent = [SentMessage(m.id, m.sender_id, m.recipient_id, m.content, m.timestamp) for m in messages]
+    db.session.commit()
+    return sent
+
+class MessageWriter:
+    """
+    Group-commits messages from send_message.
+
+    Request threads queue their message and wait. One writer thread per process takes
+    the queued messages, waiting up to `max_wait` seconds for more until it has
+    `max_batch`, writes them and commits once, then answers each request. The answer
+    only comes after the commit, so an acknowledged message is durable. A burst of
+    senders shares one commit (and one fsync) instead of paying one each.
+
+    If a batch fails, its messages are retried one at a time, so a bad message only
+    fails its own request. At most `max_pending` messages may wait; beyond that
+    submit raises WriterBusy. A message still queued after `timeout` seconds is taken
+    back out (cancelled, so the writer skips it) and also gets WriterBusy; only one the
+    writer has already started on gets WriterTimeout. With max_batch <= 1, or before
+    configure() is given an app, messages are written on the request thread.
+    """
+
+    def __init__(self, max_batch=64, max_wait=0, max_pending=1024, timeout=10):
+        self.app = None
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = Queue(max_pending)
+        self._thread = None
+        self._lock = Lock()
+
+    def configure(self, app, max_batch, max_wait, max_pending, timeout):
+        self.app = app
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        with self._lock:
+            # A running writer keeps draining the old queue; the next submit starts a new one
+            self._queue = Queue(max_pending)
+            self._thread = None
+
+    def submit(self, sender_id, recipient_id, content):
+        """Write a message and return it as a SentMessage once committed"""
+        if self.app is None or self.max_batch <= 1:
+            return write_messages([(sender_id, recipient_id, content)])[0]
+
+        future = Future()
+        try:
+            self._queue.put_nowait((sender_id, recipient_id, content, future))
+        except Full:
+            raise WriterBusy()
+        self._start()
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                raise WriterBusy()
+            raise WriterTimeout()
+
+    def _start(self):
+        # Started on first use rather than at import, so each forked server worker gets its own
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, args=(self._queue, self.app), name="message-writer", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self, queue):
+        batch = [queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self, queue, app):
+        while True:
+            # Skip messages whose sender gave up waiting, and keep the rest from being cancelled
+            batch = [item for item in self._next_batch(queue) if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with app.app_context():
+                try:
+                    self._write(batch)
+                finally:
+                    db.session.remove()
+
+    def _write(self, batch):
+        try:
+            sent = write_messages([item[:3] for item in batch])
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0][3].set_exception(e)
+                return
+            for item in batch:
+                self._write([item])
+            return
+        for item, message in zip(batch, sent):
+            item[3].set_result(message)
+
+message_writer = MessageWriter()
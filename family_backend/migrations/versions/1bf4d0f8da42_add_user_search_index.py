@@ -0,0 +1,30 @@
+"""Add trigram full-text index for user search
+
+Revision ID: 1bf4d0f8da42
+Revises: e7e7ab05b5e3
+Create Date: 2026-10-18 10:41:09.274316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1bf4d0f8da42'
+down_revision = 'e7e7ab05b5e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite-only; other databases use the prefix-match fallback in search.py
+    from search import create_user_search_index
+    create_user_search_index(op.get_bind())
+
+
+def downgrade():
+    from search import USER_SEARCH_DROP
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in USER_SEARCH_DROP:
+        op.execute(statement)
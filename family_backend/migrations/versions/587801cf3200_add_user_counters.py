@@ -0,0 +1,40 @@
+"""Add user_counters table for badge counts
+
+Revision ID: 587801cf3200
+Revises: b55e57cb1eeb
+Create Date: 2026-10-18 12:37:14.902215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '587801cf3200'
+down_revision = 'b55e57cb1eeb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_counters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('unread_messages', sa.Integer(), nullable=False),
+        sa.Column('pending_requests', sa.Integer(), nullable=False),
+        sa.Column('pending_edit_requests', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+    op.execute("""
+        INSERT INTO user_counters (user_id, unread_messages, pending_requests, pending_edit_requests)
+        SELECT u.id,
+            (SELECT COUNT(*) FROM message m WHERE m.recipient_id = u.id AND m.is_read = false),
+            (SELECT COUNT(*) FROM relationship r WHERE r.to_user_id = u.id AND r.status = 'pending'),
+            (SELECT COUNT(*) FROM relationship_edit_request e WHERE e.target_user_id = u.id AND e.status = 'pending')
+        FROM "user" u
+    """)
+
+
+def downgrade():
+    op.drop_table('user_counters')
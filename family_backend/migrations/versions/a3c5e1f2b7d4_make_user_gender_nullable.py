@@ -0,0 +1,35 @@
+"""Make user.gender nullable to match the model
+
+Revision ID: a3c5e1f2b7d4
+Revises: 587801cf3200
+Create Date: 2026-10-18 14:05:41.318207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e1f2b7d4'
+down_revision = '587801cf3200'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Registration doesn't require a gender, which PostgreSQL rejects on a NOT NULL column
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('gender', existing_type=sa.String(length=10), nullable=True)
+    _restore_user_search()
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('gender', existing_type=sa.String(length=10), nullable=False)
+    _restore_user_search()
+
+
+def _restore_user_search():
+    # On SQLite the batch op rebuilds the user table, dropping the user_search triggers
+    from search import create_user_search_index
+    create_user_search_index(op.get_bind())
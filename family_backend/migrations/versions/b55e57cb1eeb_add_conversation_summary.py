@@ -0,0 +1,52 @@
+"""Add conversation_summary table maintained by send_message
+
+Revision ID: b55e57cb1eeb
+Revises: ff0fd9ac2eed
+Create Date: 2026-10-18 11:58:36.119764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b55e57cb1eeb'
+down_revision = 'ff0fd9ac2eed'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation_summary',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('partner_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['last_message_id'], ['message.id'], ),
+        sa.ForeignKeyConstraint(['partner_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'partner_id', name='uq_conversation_summary_user_partner')
+    )
+    with op.batch_alter_table('conversation_summary', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_summary_user_last_message', ['user_id', 'last_message_id'], unique=False)
+
+    # Backfill one row per user per partner from the existing messages
+    op.execute("""
+        INSERT INTO conversation_summary (user_id, partner_id, last_message_id, unread_count)
+        SELECT user_id, partner_id, MAX(id), SUM(unread)
+        FROM (
+            SELECT sender_id AS user_id, recipient_id AS partner_id, id, 0 AS unread FROM message
+            UNION ALL
+            SELECT recipient_id, sender_id, id, CASE WHEN is_read = false THEN 1 ELSE 0 END FROM message
+        ) AS sides
+        GROUP BY user_id, partner_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation_summary', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_summary_user_last_message')
+
+    op.drop_table('conversation_summary')
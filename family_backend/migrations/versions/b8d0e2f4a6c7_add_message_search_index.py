@@ -0,0 +1,30 @@
+"""Add full-text index for message search
+
+Revision ID: b8d0e2f4a6c7
+Revises: f2a4c6e8b0d1
+Create Date: 2026-10-18 19:12:44.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d0e2f4a6c7'
+down_revision = 'f2a4c6e8b0d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 is SQLite-only; other databases use the substring fallback in search.py
+    from search import create_message_search_index
+    create_message_search_index(op.get_bind())
+
+
+def downgrade():
+    from search import MESSAGE_SEARCH_DROP
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in MESSAGE_SEARCH_DROP:
+        op.execute(statement)
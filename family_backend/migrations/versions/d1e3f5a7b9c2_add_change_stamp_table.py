@@ -0,0 +1,28 @@
+"""Add change_stamp table for syncing in-memory state across workers
+
+Revision ID: d1e3f5a7b9c2
+Revises: b8d0e2f4a6c7
+Create Date: 2026-10-19 10:21:06.482113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1e3f5a7b9c2'
+down_revision = 'b8d0e2f4a6c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_stamp',
+        sa.Column('key', sa.String(length=32), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('change_stamp')
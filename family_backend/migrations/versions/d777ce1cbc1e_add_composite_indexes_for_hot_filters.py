@@ -0,0 +1,87 @@
+"""Add composite indexes for hot filters and unique user pair
+
+Revision ID: d777ce1cbc1e
+Revises: 3cbb87e490d8
+Create Date: 2026-10-18 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql.expression import Grouping
+
+
+# revision identifiers, used by Alembic.
+revision = 'd777ce1cbc1e'
+down_revision = '3cbb87e490d8'
+branch_labels = None
+depends_on = None
+
+
+def _decline_duplicate_pairs():
+    # Older databases may hold several live rows for the same pair of users.
+    # Keep the approved one (or the oldest) and decline the rest so the unique index can be built.
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT id, from_user_id, to_user_id, status FROM relationship "
+        "WHERE status != 'declined' ORDER BY id"
+    )).fetchall()
+
+    keep = {}
+    duplicates = []
+    for rel_id, from_id, to_id, status in rows:
+        pair = (min(from_id, to_id), max(from_id, to_id))
+        if pair not in keep:
+            keep[pair] = (rel_id, status)
+        elif status == 'approved' and keep[pair][1] != 'approved':
+            duplicates.append(keep[pair][0])
+            keep[pair] = (rel_id, status)
+        else:
+            duplicates.append(rel_id)
+
+    for rel_id in duplicates:
+        bind.execute(sa.text("UPDATE relationship SET status = 'declined' WHERE id = :id"), {"id": rel_id})
+
+
+def upgrade():
+    _decline_duplicate_pairs()
+
+    from_user_id = sa.column('from_user_id')
+    to_user_id = sa.column('to_user_id')
+
+    with op.batch_alter_table('relationship', schema=None) as batch_op:
+        batch_op.create_index('ix_relationship_to_user_status', ['to_user_id', 'status'], unique=False)
+        batch_op.create_index('ix_relationship_from_user_status', ['from_user_id', 'status'], unique=False)
+
+    op.create_index(
+        'uq_relationship_user_pair',
+        'relationship',
+        [
+            Grouping(sa.case((from_user_id < to_user_id, from_user_id), else_=to_user_id)),
+            Grouping(sa.case((from_user_id < to_user_id, to_user_id), else_=from_user_id)),
+        ],
+        unique=True,
+        sqlite_where=sa.text("status != 'declined'"),
+        postgresql_where=sa.text("status != 'declined'")
+    )
+
+    with op.batch_alter_table('relationship_edit_request', schema=None) as batch_op:
+        batch_op.create_index('ix_relationship_edit_request_target_status', ['target_user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_sender_recipient_timestamp', ['sender_id', 'recipient_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_message_recipient_is_read', ['recipient_id', 'is_read'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_recipient_is_read')
+        batch_op.drop_index('ix_message_sender_recipient_timestamp')
+
+    with op.batch_alter_table('relationship_edit_request', schema=None) as batch_op:
+        batch_op.drop_index('ix_relationship_edit_request_target_status')
+
+    op.drop_index('uq_relationship_user_pair', table_name='relationship')
+
+    with op.batch_alter_table('relationship', schema=None) as batch_op:
+        batch_op.drop_index('ix_relationship_from_user_status')
+        batch_op.drop_index('ix_relationship_to_user_status')
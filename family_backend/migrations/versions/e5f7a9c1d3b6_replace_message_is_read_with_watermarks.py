@@ -0,0 +1,68 @@
+"""Replace message.is_read with per-conversation read watermarks
+
+Revision ID: e5f7a9c1d3b6
+Revises: c4d2b8e6f1a9
+Create Date: 2026-10-18 16:02:37.118420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5f7a9c1d3b6'
+down_revision = 'c4d2b8e6f1a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversation_summary', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=False, server_default='0'))
+
+    # Everything before the partner's oldest unread message counts as read
+    op.execute("""
+        UPDATE conversation_summary SET last_read_message_id = COALESCE(
+            (SELECT MIN(m.id) - 1 FROM message m
+             WHERE m.sender_id = conversation_summary.partner_id
+               AND m.recipient_id = conversation_summary.user_id
+               AND m.is_read = false),
+            last_message_id
+        )
+    """)
+    op.execute("""
+        UPDATE conversation_summary SET unread_count = (
+            SELECT COUNT(*) FROM message m
+            WHERE m.sender_id = conversation_summary.partner_id
+              AND m.recipient_id = conversation_summary.user_id
+              AND m.id > conversation_summary.last_read_message_id
+        )
+    """)
+    op.execute("""
+        UPDATE user_counters SET unread_messages = COALESCE(
+            (SELECT SUM(s.unread_count) FROM conversation_summary s WHERE s.user_id = user_counters.user_id), 0
+        )
+    """)
+
+    # Not batch mode: rebuilding the table on SQLite would lose the expression index
+    # ix_message_pair_id, and SQLite 3.35+ can drop the column in place
+    op.drop_index('ix_message_recipient_is_read', table_name='message')
+    op.drop_column('message', 'is_read')
+
+
+def downgrade():
+    op.add_column('message', sa.Column('is_read', sa.Boolean(), nullable=True))
+
+    op.execute("""
+        UPDATE message SET is_read = EXISTS (
+            SELECT 1 FROM conversation_summary s
+            WHERE s.user_id = message.recipient_id
+              AND s.partner_id = message.sender_id
+              AND s.last_read_message_id >= message.id
+        )
+    """)
+
+    op.create_index('ix_message_recipient_is_read', 'message', ['recipient_id', 'is_read'], unique=False)
+
+    with op.batch_alter_table('conversation_summary', schema=None) as batch_op:
+        batch_op.drop_column('last_read_message_id')
@@ -0,0 +1,27 @@
+"""Add avatar_hash to user for the content-addressed avatar store
+
+Revision ID: e7e7ab05b5e3
+Revises: d777ce1cbc1e
+Create Date: 2026-10-18 10:03:27.882051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7e7ab05b5e3'
+down_revision = 'd777ce1cbc1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing base64 pictures are moved out with `flask migrate-avatars`
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avatar_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('avatar_hash')
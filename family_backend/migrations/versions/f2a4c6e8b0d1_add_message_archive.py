@@ -0,0 +1,38 @@
+"""Add message_archive table for archived message segments
+
+Revision ID: f2a4c6e8b0d1
+Revises: e5f7a9c1d3b6
+Create Date: 2026-10-18 16:48:12.603975
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a4c6e8b0d1'
+down_revision = 'e5f7a9c1d3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message_archive',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_low', sa.Integer(), nullable=False),
+        sa.Column('user_high', sa.Integer(), nullable=False),
+        sa.Column('first_message_id', sa.Integer(), nullable=False),
+        sa.Column('last_message_id', sa.Integer(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.create_index('ix_message_archive_pair_last_message', ['user_low', 'user_high', 'last_message_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message_archive', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_archive_pair_last_message')
+
+    op.drop_table('message_archive')
@@ -0,0 +1,36 @@
+"""Add unordered (sender, recipient) pair + id index on message
+
+Revision ID: ff0fd9ac2eed
+Revises: 1bf4d0f8da42
+Create Date: 2026-10-18 11:20:52.660413
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql.expression import Grouping
+
+
+# revision identifiers, used by Alembic.
+revision = 'ff0fd9ac2eed'
+down_revision = '1bf4d0f8da42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    sender_id = sa.column('sender_id')
+    recipient_id = sa.column('recipient_id')
+    op.create_index(
+        'ix_message_pair_id',
+        'message',
+        [
+            Grouping(sa.case((sender_id < recipient_id, sender_id), else_=recipient_id)),
+            Grouping(sa.case((sender_id < recipient_id, recipient_id), else_=sender_id)),
+            sa.column('id'),
+        ],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_message_pair_id', table_name='message')
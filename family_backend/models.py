@@ -1,14 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.sql.expression import Grouping
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
-    profile_pic = db.Column(db.Text)  # Changed to Text to support large base64 images
+    profile_pic = db.Column(db.Text)  # External picture URL (legacy rows may still hold base64)
+    avatar_hash = db.Column(db.String(64))  # SHA-256 of the uploaded picture in the avatar store
     gender = db.Column(db.String(10), nullable=True)  # 'male' or 'female'
 
     # New profile fields
@@ -23,6 +26,20 @@ class User(UserMixin, db.Model):
     bio_private = db.Column(db.Boolean, default=False)
     location_private = db.Column(db.Boolean, default=False)
 
+def unordered_pair(column_a, column_b):
+    """(low, high) expressions for a pair of user id columns, so A->B and B->A index the same"""
+    # Parenthesised because PostgreSQL only accepts bare column or function expressions in an index
+    return (
+        Grouping(db.case((column_a < column_b, column_a), else_=column_b)),
+        Grouping(db.case((column_a < column_b, column_b), else_=column_a))
+    )
+
+class UserSession(db.Model):
+    """A signed-in session; deleting the row revokes its token (see sessions.py)"""
+    id = db.Column(db.String(32), primary_key=True)  # Random id carried inside the signed token
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
 class Relationship(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     from_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -32,6 +49,22 @@ class Relationship(db.Model):
     status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'approved', 'declined'
     is_bidirectional = db.Column(db.Boolean, default=False)  # True when both sides are set
 
+    from_user = db.relationship('User', foreign_keys=[from_user_id])
+    to_user = db.relationship('User', foreign_keys=[to_user_id])
+
+    __table_args__ = (
+        db.Index('ix_relationship_to_user_status', 'to_user_id', 'status'),
+        db.Index('ix_relationship_from_user_status', 'from_user_id', 'status'),
+        # At most one live (pending or approved) relationship per pair of users
+        db.Index(
+            'uq_relationship_user_pair',
+            *unordered_pair(from_user_id, to_user_id),
+            unique=True,
+            sqlite_where=db.text("status != 'declined'"),
+            postgresql_where=db.text("status != 'declined'")
+        ),
+    )
+
 class RelationshipEditRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     relationship_id = db.Column(db.Integer, db.ForeignKey('relationship.id'), nullable=False)
@@ -42,11 +75,75 @@ class RelationshipEditRequest(db.Model):
     field_to_change = db.Column(db.String(50), nullable=False)  # 'relationship_type' or 'reverse_relationship_type'
     status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'approved', 'declined'
 
+    relationship = db.relationship('Relationship', foreign_keys=[relationship_id])
+    requesting_user = db.relationship('User', foreign_keys=[requesting_user_id])
+    target_user = db.relationship('User', foreign_keys=[target_user_id])
+
+    __table_args__ = (
+        db.Index('ix_relationship_edit_request_target_status', 'target_user_id', 'status'),
+    )
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
-    is_read = db.Column(db.Boolean, default=False)
 
+    sender = db.relationship('User', foreign_keys=[sender_id])
+    recipient = db.relationship('User', foreign_keys=[recipient_id])
+
+    __table_args__ = (
+        db.Index('ix_message_sender_recipient_timestamp', 'sender_id', 'recipient_id', 'timestamp'),
+        # Keyset pagination over one conversation, whichever side sent each message
+        db.Index('ix_message_pair_id', *unordered_pair(sender_id, recipient_id), id),
+    )
+
+class MessageArchive(db.Model):
+    """
+    A segment of old messages from one conversation, moved out of the message table by
+    `flask archive-messages`. Written once and never updated; segments of a conversation
+    cover consecutive id ranges, all older than its messages still in the message table.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_low = db.Column(db.Integer, nullable=False)  # The conversation, as in unordered_pair
+    user_high = db.Column(db.Integer, nullable=False)
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON rows, oldest first
+
+    __table_args__ = (
+        db.Index('ix_message_archive_pair_last_message', 'user_low', 'user_high', 'last_message_id'),
+    )
+
+
+class ConversationSummary(db.Model):
+    """One row per user per conversation partner, maintained as messages are sent and read"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)  # Messages from partner not yet read by user
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0)  # User has read partner's messages up to this id
+
+    partner = db.relationship('User', foreign_keys=[partner_id])
+    last_message = db.relationship('Message', foreign_keys=[last_message_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'partner_id', name='uq_conversation_summary_user_partner'),
+        # Inbox order: most recent conversation first
+        db.Index('ix_conversation_summary_user_last_message', 'user_id', 'last_message_id'),
+    )
+
+class UserCounters(db.Model):
+    """Denormalised badge counts, updated in the same transaction as the rows they count"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread_messages = db.Column(db.Integer, nullable=False, default=0)
+    pending_requests = db.Column(db.Integer, nullable=False, default=0)  # Incoming connection requests
+    pending_edit_requests = db.Column(db.Integer, nullable=False, default=0)
+
+class ChangeStamp(db.Model):
+    """Version counters that processes bump after changing data other processes keep in memory (stamps.py)"""
+    key = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
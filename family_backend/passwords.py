@@ -0,0 +1,92 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from threading import BoundedSemaphore, Lock
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HasherBusy(Exception):
+    """Too many hashes are already queued; the caller should retry later"""
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+def _method_prefix(method):
+    # Werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1", "pbkdf2" ->
+    # "pbkdf2:sha256:600000"), so compare against what it actually writes
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+class PasswordHasher:
+    """
+    Runs password hashing and checking in a small process pool.
+
+    Hashing is deliberately slow, and a burst of logins hashing on request threads
+    takes CPU from every other request in the worker. Sending the work to `workers`
+    processes caps how much CPU hashing can use at once. At most `max_pending` hashes
+    may be running or queued; further callers wait up to `timeout` seconds for a slot,
+    and again for the result, and then get HasherBusy. With workers=0 hashing runs
+    inline on the calling thread.
+    """
+
+    def __init__(self, method="scrypt:32768:8:1", workers=0, max_pending=32, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = Lock()
+        self._prefix = None
+
+    def configure(self, method, workers, max_pending, timeout):
+        with self._lock:
+            self.shutdown()
+            self.method = method
+            self.workers = workers
+            self.timeout = timeout
+            self._slots = BoundedSemaphore(max_pending)
+            self._prefix = _method_prefix(method)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Pool processes come from a fresh forkserver that only imports this module,
+                # never from the threaded server process itself
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy()
+        try:
+            future = self._executor().submit(fn, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                raise HasherBusy()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(_check, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with different parameters than the configured method"""
+        if self._prefix is None:
+            self._prefix = _method_prefix(self.method)
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from threading import Lock
+from sqlalchemy import select
+from models import db, User
+from avatars import avatar_url, is_inline_image
+from graph import family_graph
+from cache import cache_stamp
+
+PROFILE_FIELDS = ("phone", "job", "bio", "location")
+
+class Profile:
+    """The three projections of one user's profile, plus what avatar_url needs"""
+    __slots__ = ("id", "avatar_hash", "profile_pic", "own", "connected", "public")
+
+    def __init__(self, row):
+        self.id = row.id
+        self.avatar_hash = row.avatar_hash
+        # Inline base64 pictures are never served from the profile, so don't keep them
+        self.profile_pic = row.profile_pic if row.profile_pic and not is_inline_image(row.profile_pic) else None
+
+        privacy = {f"{field}_private": getattr(row, f"{field}_private") for field in PROFILE_FIELDS}
+        fields = {field: getattr(row, field) for field in PROFILE_FIELDS}
+        base = {"id": row.id, "name": row.name, **privacy}
+
+        self.own = {**base, **fields, "email": row.email, "is_own_profile": True, "is_connected": True}
+        self.connected = {**base, **fields, "email": row.email, "is_own_profile": False, "is_connected": True}
+        self.public = {
+            **base,
+            **{field: None if privacy[f"{field}_private"] else value for field, value in fields.items()},
+            "email": None,
+            "is_own_profile": False,
+            "is_connected": False
+        }
+
+class ProfileCache:
+    """
+    In-process LRU of precomputed profile projections, keyed by user id.
+
+    Only profile edits (update_profile, delete_user) invalidate an entry; edits in
+    another worker clear the whole cache through cache_stamp (see stamps.py). Which
+    projection a viewer gets depends on whether they are connected, which is read
+    from the family graph at request time, so relationship changes need no work here.
+
+    A load that started before an invalidation may have read the old row, so loads
+    are only cached if the user's generation (bumped by invalidate) and the cache's
+    epoch (bumped by clear) are unchanged since they started.
+    """
+
+    def __init__(self, max_entries=10000):
+        self._lock = Lock()
+        self._profiles = OrderedDict()
+        self._generations = {}  # user_id -> invalidations since the last clear
+        self._epoch = 0
+        self.max_entries = max_entries
+
+    def get_many(self, user_ids):
+        """Map each existing user id to its Profile, loading misses in one query"""
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                profile = self._profiles.get(user_id)
+                if profile is not None:
+                    self._profiles.move_to_end(user_id)
+                    found[user_id] = profile
+
+            missing = [user_id for user_id in user_ids if user_id not in found]
+            epoch = self._epoch
+            generations = {user_id: self._generations.get(user_id, 0) for user_id in missing}
+
+        if missing:
+            # Cached until the next profile edit, so read the primary rather than a replica
+            with db.engine.connect() as connection:
+                rows = connection.execute(select(
+                    User.id, User.name, User.email, User.avatar_hash, User.profile_pic,
+                    *(getattr(User, field) for field in PROFILE_FIELDS),
+                    *(getattr(User, f"{field}_private") for field in PROFILE_FIELDS)
+                ).where(User.id.in_(missing))).all()
+            with self._lock:
+                for row in rows:
+                    profile = found[row.id] = Profile(row)
+                    if epoch == self._epoch and generations[row.id] == self._generations.get(row.id, 0):
+                        self._profiles[row.id] = profile
+                while len(self._profiles) > self.max_entries:
+                    self._profiles.popitem(last=False)
+        return found
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._profiles.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        cache_stamp.publish()
+
+    def clear(self):
+        """Drop every entry, e.g. after another process changed profiles"""
+        with self._lock:
+            self._profiles.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+def view_profile(profile, viewer_id):
+    """The projection of a profile that viewer_id is allowed to see"""
+    if viewer_id == profile.id:
+        data = profile.own
+    elif viewer_id and family_graph.are_connected(viewer_id, profile.id):
+        data = profile.connected
+    else:
+        data = profile.public
+    return {**data, "profile_pic": avatar_url(profile, "medium")}
+
+profile_cache = ProfileCache()
+cache_stamp.listeners.append(profile_cache.clear)
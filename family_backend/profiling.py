@@ -0,0 +1,192 @@
+import hashlib
+import re
+import time
+from bisect import bisect_left
+from threading import Lock
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+from models import db
+
+# Upper bounds of the queries-per-request histogram; an N+1 loop shows up in the top buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+def _statement_label(statement):
+    # Statements use bound parameters, so this is the query shape, never user data.
+    # Long ones are cut short, with a hash of the whole so each stays its own series.
+    label = re.sub(r"\s+", " ", statement).strip()
+    if len(label) > 200:
+        label = label[:200] + "... #" + hashlib.sha1(label.encode()).hexdigest()[:8]
+    return label
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+class RequestStats:
+    """SQL issued while handling one request"""
+
+    def __init__(self, slow_statements):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest = {}  # statement -> longest run, at most slow_statements entries
+        self.slow_statements = slow_statements
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        if seconds > self.slowest.get(statement, -1):
+            self.slowest[statement] = seconds
+            if len(self.slowest) > self.slow_statements:
+                del self.slowest[min(self.slowest, key=self.slowest.get)]
+
+class RouteStats:
+    """Totals for one (route, method) since the process started"""
+
+    def __init__(self):
+        self.statuses = {}
+        self.seconds = 0.0
+        self.response_bytes = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.max_queries = 0
+        self.query_buckets = [0] * (len(QUERY_COUNT_BUCKETS) + 1)  # the last is +Inf
+        self.slowest = {}  # statement label -> longest run
+
+class RequestProfiler:
+    """
+    Opt-in per-request SQL profiling (PROFILING=1).
+
+    SQLAlchemy cursor events time every statement a request thread runs, and the
+    request hooks add them up per request: the response carries X-Query-Count, and
+    per-route totals (requests, latency, response bytes, query counts and time, a
+    queries-per-request histogram and the slowest statements) are served at /metrics
+    in Prometheus text format. Queries on other threads, such as the message writer's
+    group commits, aren't attributed to any request. Totals are per process, like the
+    response cache.
+    """
+
+    def __init__(self, slow_statements=5):
+        self.slow_statements = slow_statements
+        self._lock = Lock()
+        self._routes = {}
+
+    def configure(self, app, slow_statements):
+        self.slow_statements = slow_statements
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self.metrics)
+
+    # The start time lives on the statement's execution context rather than a stack in
+    # conn.info: a statement that raises never reaches after_cursor_execute, and a stack
+    # entry left behind would grow with the pooled connection and skew later timings
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.profiling_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "profiling_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        stats = g.get("request_stats") if has_app_context() else None
+        if stats is not None:
+            stats.add(statement, seconds)
+
+    def _start_request(self):
+        g.request_stats = RequestStats(self.slow_statements)
+
+    def _finish_request(self, response):
+        stats = g.pop("request_stats", None)
+        if stats is None:
+            return response
+        response.headers["X-Query-Count"] = str(stats.queries)
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        # Streamed responses (/events) have no length up front
+        size = response.content_length or 0
+        self._record((route, request.method), response.status_code, time.perf_counter() - stats.started, size, stats)
+        return response
+
+    def _record(self, key, status, seconds, size, stats):
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                route = self._routes[key] = RouteStats()
+            route.statuses[status] = route.statuses.get(status, 0) + 1
+            route.seconds += seconds
+            route.response_bytes += size
+            route.queries += stats.queries
+            route.query_seconds += stats.seconds
+            route.max_queries = max(route.max_queries, stats.queries)
+            route.query_buckets[bisect_left(QUERY_COUNT_BUCKETS, stats.queries)] += 1
+            for statement, statement_seconds in stats.slowest.items():
+                statement = _statement_label(statement)
+                if statement_seconds > route.slowest.get(statement, -1):
+                    route.slowest[statement] = statement_seconds
+            while len(route.slowest) > self.slow_statements:
+                del route.slowest[min(route.slowest, key=route.slowest.get)]
+
+    def metrics(self):
+        """Per-route request and SQL totals in Prometheus text format"""
+        with self._lock:
+            body = self._render(sorted(self._routes.items()))
+        return Response(body, mimetype="text/plain; version=0.0.4")
+
+    def _render(self, snapshot):
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        metric("http_requests_total", "counter", "Requests handled, by route, method and status.", [
+            f"http_requests_total{_labels(route=route, method=method, status=status)} {count}"
+            for (route, method), stats in snapshot for status, count in sorted(stats.statuses.items())
+        ])
+        metric("http_request_duration_seconds", "summary", "Time spent handling requests.", [
+            sample for (route, method), stats in snapshot for sample in (
+                f"http_request_duration_seconds_sum{_labels(route=route, method=method)} {stats.seconds}",
+                f"http_request_duration_seconds_count{_labels(route=route, method=method)} {sum(stats.statuses.values())}",
+            )
+        ])
+        metric("http_response_bytes_total", "counter", "Response body bytes sent (streamed responses count 0).", [
+            f"http_response_bytes_total{_labels(route=route, method=method)} {stats.response_bytes}"
+            for (route, method), stats in snapshot
+        ])
+        metric("db_queries_total", "counter", "SQL statements run while handling requests.", [
+            f"db_queries_total{_labels(route=route, method=method)} {stats.queries}"
+            for (route, method), stats in snapshot
+        ])
+        metric("db_query_duration_seconds_total", "counter", "Time spent in SQL statements while handling requests.", [
+            f"db_query_duration_seconds_total{_labels(route=route, method=method)} {stats.query_seconds}"
+            for (route, method), stats in snapshot
+        ])
+        metric("db_queries_per_request", "histogram", "SQL statements per request.", [
+            sample for (route, method), stats in snapshot for sample in self._histogram(route, method, stats)
+        ])
+        metric("db_queries_per_request_max", "gauge", "Most SQL statements any one request has run.", [
+            f"db_queries_per_request_max{_labels(route=route, method=method)} {stats.max_queries}"
+            for (route, method), stats in snapshot
+        ])
+        metric("db_slowest_query_seconds", "gauge", "Longest run of each of the route's slowest statements.", [
+            f"db_slowest_query_seconds{_labels(route=route, method=method, statement=statement)} {seconds}"
+            for (route, method), stats in snapshot
+            for statement, seconds in sorted(stats.slowest.items(), key=lambda item: -item[1])
+        ])
+        return "\n".join(lines) + "\n"
+
+    def _histogram(self, route, method, stats):
+        total = 0
+        for bound, count in zip(QUERY_COUNT_BUCKETS + ("+Inf",), stats.query_buckets):
+            total += count
+            yield f"db_queries_per_request_bucket{_labels(route=route, method=method, le=bound)} {total}"
+        yield f"db_queries_per_request_sum{_labels(route=route, method=method)} {stats.queries}"
+        yield f"db_queries_per_request_count{_labels(route=route, method=method)} {total}"
+
+request_profiler = RequestProfiler()
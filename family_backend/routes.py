@@ -1,75 +1,64 @@
-from flask import Blueprint, request, jsonify
-from models import db, Relationship, User, RelationshipEditRequest, Message
-from sqlalchemy import or_, and_
+import csv
+import io
+from flask import Blueprint, request, jsonify, current_app, g, send_file, Response, stream_with_context
+from models import db, Relationship, User, RelationshipEditRequest, Message, ConversationSummary, UserCounters, unordered_pair
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from tree import build_tree
+from kinship import get_reverse_relationship, compose_path
+from graph import family_graph
+from avatars import AVATAR_SIZES, AvatarError, avatar_url, find_avatar_file, set_profile_pic
+from search import search_users, search_messages
+from conversations import mark_read, read_watermarks, delete_user_conversations
+from events import event_hub, stream_events
+from counters import adjust_counters, get_badges
+from bulk import parse_csv, parse_gedcom, import_relationships, export_tree_csv
+from cache import USERS, RELATIONSHIPS, user_key, response_cache, cached_response
+from profiles import profile_cache, view_profile
+from database import replica_read
+from sessions import session_cache, identity_error, acts_as
+from message_writer import WriterBusy, WriterTimeout, message_writer
+from archive import archived_before, archived_after
 
-def get_reverse_relationship(original_relationship, sender_gender, receiver_gender):
-    """
-    Determine the reverse relationship based on the original relationship and genders.
-    Returns the suggested relationship from receiver to sender.
-    
-    Example: If sender says receiver is their "Son", 
-    then receiver should call sender their "Father" or "Mother" (based on sender's gender)
-    """
-    relationship = original_relationship.lower()
-    
-    # Family relationships mapping
-    if relationship == 'father':
-        # If they say you're their father, you call them son/daughter (based on THEIR gender)
-        return 'Daughter' if sender_gender == 'female' else 'Son'
-    elif relationship == 'mother':
-        # If they say you're their mother, you call them son/daughter (based on THEIR gender)
-        return 'Daughter' if sender_gender == 'female' else 'Son'
-    elif relationship == 'son':
-        # If they say you're their son, you call them father/mother (based on THEIR gender)
-        return 'Mother' if sender_gender == 'female' else 'Father'
-    elif relationship == 'daughter':
-        # If they say you're their daughter, you call them father/mother (based on THEIR gender)
-        return 'Mother' if sender_gender == 'female' else 'Father'
-    elif relationship == 'brother':
-        # If they say you're their brother, you call them brother/sister (based on THEIR gender)
-        return 'Sister' if sender_gender == 'female' else 'Brother'
-    elif relationship == 'sister':
-        # If they say you're their sister, you call them brother/sister (based on THEIR gender)
-        return 'Sister' if sender_gender == 'female' else 'Brother'
-    
-    # For custom relationships, we can't determine the reverse automatically
-    return None
-
-def build_tree(user_id, visited=None):
-    if visited is None:
-        visited = set()
-
-    if user_id in visited:
-        return None  # Prevent circular references / infinite loops
-
-    visited.add(user_id)
-
-    user = User.query.get(user_id)
-    if not user:
-        return None
-
-    relationships = Relationship.query.filter_by(from_user_id=user_id).all()
-
-    relatives = []
-    for rel in relationships:
-        child_tree = build_tree(rel.to_user_id, visited)
-        if child_tree:
-            relatives.append({
-                "id": child_tree["id"],
-                "name": child_tree["name"],
-                "relationship": rel.relationship_type,
-                "relations": child_tree["relations"]
-            })
+main_bp = Blueprint('main', __name__)
 
+def serialize_message(message, viewer_id, last_read=None):
+    """last_read maps user ids to their read watermark in this conversation (see read_watermarks)"""
     return {
-        "id": user.id,
-        "name": user.name,
-        "relations": relatives
+        "id": message.id,
+        "sender_id": message.sender_id,
+        "recipient_id": message.recipient_id,
+        "content": message.content,
+        "timestamp": message.timestamp.isoformat(),
+        "is_read": message.id <= (last_read or {}).get(message.recipient_id, 0),
+        "is_from_me": message.sender_id == viewer_id
     }
 
-main_bp = Blueprint('main', __name__)
+def relationship_changed(rel):
+    """Bump the cached-response stamps a relationship write affects"""
+    response_cache.bump(RELATIONSHIPS, user_key(rel.from_user_id), user_key(rel.to_user_id))
+
+def conversation_filter(user_a, user_b):
+    """Filter for messages between two users that matches the ix_message_pair_id index"""
+    low, high = unordered_pair(Message.sender_id, Message.recipient_id)
+    return and_(low == min(user_a, user_b), high == max(user_a, user_b))
+
+def int_field(data, name, default=None):
+    """data[name] as an int (JSON clients may send "5"), or default if it's missing"""
+    value = data.get(name)
+    if value is None:
+        return default
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError(f"{name} must be an integer")
 
 @main_bp.route('/users', methods=["GET"])
+@replica_read
+@cached_response(lambda: [USERS])
 def get_all_users():
     users = User.query.all()
 
@@ -89,26 +78,108 @@ def get_all_users():
         # "location_private": u.location_private
     } for u in users])
 
+@main_bp.route('/users/search', methods=["GET"])
+@replica_read
+def search_people():
+    """Find users by exact email, or by name/email/phone substring, one page at a time"""
+    email = request.args.get('email', '').strip()
+    query = request.args.get('q', '').strip()
+    after_id = request.args.get('after_id', default=0, type=int)
+    limit = request.args.get('limit', default=20, type=int)
+    max_limit = current_app.config['USER_SEARCH_MAX_LIMIT']
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, max_limit)
+
+    if email:
+        # Exact lookup through the unique email index
+        user = User.query.filter_by(email=email).first()
+        users = [user] if user and user.id > after_id else []
+    elif query:
+        users = search_users(query, after_id, limit)
+    else:
+        return jsonify({"error": "Provide q or email"}), 400
+
+    return jsonify({
+        "users": [{"id": u.id, "name": u.name, "email": u.email} for u in users],
+        "next_cursor": users[-1].id if len(users) == limit else None
+    })
+
+@main_bp.route('/users/<int:user_id>', methods=["GET"])
+@replica_read
+def get_user(user_id):
+    user = db.session.get(User, user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    return jsonify({
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "profile_pic": avatar_url(user)
+    })
+
+@main_bp.route('/avatars/<digest>', methods=["GET"])
+def get_avatar(digest):
+    """Serve a stored profile picture; content never changes for a given hash, so cache it for good"""
+    size = request.args.get('size', 'original')
+    if size not in AVATAR_SIZES:
+        return jsonify({"error": f"size must be one of {', '.join(AVATAR_SIZES)}"}), 400
+
+    found = find_avatar_file(digest, size)
+    if not found:
+        return jsonify({"error": "Avatar not found"}), 404
+
+    path, mimetype = found
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=f"{digest}-{size}",
+        max_age=current_app.config['AVATAR_CACHE_SECONDS'],
+        conditional=True
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @main_bp.route('/connect', methods=['POST'])
 def connect():
     data = request.json
 
     # Expecting a JSON body like:
     # {
-    #   "from_user_id": 1,
+    #   "from_user_id": 1,  (optional when signed in)
     #   "to_user_id": 2,
     #   "relationship_type": "father"
     # }
+    from_user_id = data.get('from_user_id', g.get('user_id'))
+    if from_user_id is None or not all(key in data for key in ['to_user_id', 'relationship_type']):
+        return jsonify({"error": "Missing required fields"}), 400
+    error = identity_error(from_user_id)
+    if error:
+        return error
 
     new_relationship = Relationship(
-        from_user_id=data['from_user_id'],
+        from_user_id=from_user_id,
         to_user_id=data['to_user_id'],
         relationship_type=data['relationship_type'],
         status='pending'  # New requests are pending
     )
 
     db.session.add(new_relationship)
-    db.session.commit()
+    try:
+        adjust_counters(new_relationship.to_user_id, pending_requests=1)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "A relationship or pending request between these users already exists"}), 409
+    family_graph.update(new_relationship)
+    relationship_changed(new_relationship)
+    event_hub.publish(new_relationship.to_user_id, "relationship_request", {
+        "request_id": new_relationship.id,
+        "from_user_id": new_relationship.from_user_id,
+        "relationship": new_relationship.relationship_type
+    })
 
     return jsonify({"message": "Connection request sent!"})
 
@@ -117,11 +188,16 @@ def update_relationship(relationship_id):
     rel = Relationship.query.get(relationship_id)
     if not rel:
         return jsonify({"error": "Relationship not found"}), 404
+    error = identity_error(rel.from_user_id, rel.to_user_id)
+    if error:
+        return error
 
     data = request.json
     if "relationship_type" in data:
         rel.relationship_type = data["relationship_type"]
         db.session.commit()
+        family_graph.update(rel)
+        relationship_changed(rel)
         return jsonify({"message": "Relationship updated"})
     return jsonify({"error": "No valid fields to update"}), 400
 
@@ -130,12 +206,21 @@ def delete_relationship(relationship_id):
     rel = Relationship.query.get(relationship_id)
     if not rel:
         return jsonify({"error": "Relationship not found"}), 404
+    error = identity_error(rel.from_user_id, rel.to_user_id)
+    if error:
+        return error
 
+    rel_id = rel.id
+    if rel.status == 'pending':
+        adjust_counters(rel.to_user_id, pending_requests=-1)
     db.session.delete(rel)
     db.session.commit()
+    family_graph.remove(rel_id)
+    relationship_changed(rel)
     return jsonify({"message": "Relationship deleted"})
 
 @main_bp.route('/update_profile/<int:user_id>', methods=["POST"])
+@acts_as('user_id')
 def update_profile(user_id):
     user = User.query.get(user_id)
     if not user:
@@ -149,7 +234,10 @@ def update_profile(user_id):
     if "name" in data:
         user.name = data["name"]
     if "profile_pic" in data:
-        user.profile_pic = data["profile_pic"]
+        try:
+            set_profile_pic(user, data["profile_pic"])
+        except AvatarError as e:
+            return jsonify({"error": str(e)}), 400
 
     # Update new profile fields
     if "phone" in data:
@@ -174,6 +262,13 @@ def update_profile(user_id):
     try:
         db.session.commit()
         print("Database commit successful")
+        profile_cache.invalidate(user_id)
+        # Name and picture appear in other users' relationship and conversation lists
+        partner_ids = [uid for uid, in db.session.query(ConversationSummary.user_id).filter_by(partner_id=user_id)]
+        response_cache.bump(
+            USERS, user_key(user_id),
+            *(user_key(uid) for uid in family_graph.neighbour_ids(user_id) | set(partner_ids))
+        )
         return jsonify({"message": "Profile updated successfully."})
     except Exception as e:
         print(f"Database commit failed: {str(e)}")
@@ -181,37 +276,27 @@ def update_profile(user_id):
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 @main_bp.route('/relationships/<int:user_id>', methods=["GET"])
+@replica_read
+@cached_response(lambda user_id: [user_key(user_id)])
 def get_relationships(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    # Get all approved bidirectional relationships where the user is involved
-    relationships = Relationship.query.filter(
-        ((Relationship.from_user_id == user_id) | (Relationship.to_user_id == user_id)) &
-        (Relationship.status == 'approved') &
-        (Relationship.is_bidirectional == True)
-    ).all()
+    # All approved bidirectional relationships where the user is involved, from the graph index
+    links = sorted(family_graph.neighbours(user_id))
+    other_ids = {other_id for _, other_id, _, _ in links}
+    others = {u.id: u for u in User.query.filter(User.id.in_(other_ids)).all()} if other_ids else {}
 
     results = []
-    for rel in relationships:
-        if rel.from_user_id == user_id:
-            # User is the sender
-            other_user = User.query.get(rel.to_user_id)
-            my_relationship_type = rel.relationship_type
-            their_relationship_type = rel.reverse_relationship_type
-        else:
-            # User is the receiver
-            other_user = User.query.get(rel.from_user_id)
-            my_relationship_type = rel.reverse_relationship_type
-            their_relationship_type = rel.relationship_type
-
+    for rel_id, other_id, my_relationship_type, their_relationship_type in links:
+        other_user = others.get(other_id)
         if other_user:
             results.append({
-                "relationship_id": rel.id,
+                "relationship_id": rel_id,
                 "relative_id": other_user.id,
                 "name": other_user.name,
-                "profile_pic": other_user.profile_pic,
+                "profile_pic": avatar_url(other_user),
                 "my_relationship_type": my_relationship_type,
                 "their_relationship_type": their_relationship_type,
                 "can_edit": True
@@ -220,44 +305,172 @@ def get_relationships(user_id):
     return jsonify(results)
 
 @main_bp.route('/tree/<int:user_id>', methods=["GET"])
+@replica_read
+# A tree spans many users, so any user or relationship change invalidates every tree
+@cached_response(lambda user_id: [USERS, RELATIONSHIPS])
 def get_family_tree(user_id):
-    tree = build_tree(user_id)
+    # Depth and size are capped by config so a huge family can't stall the request
+    depth_limit = current_app.config['TREE_MAX_DEPTH']
+    node_limit = current_app.config['TREE_MAX_NODES']
+    max_depth = request.args.get('max_depth', default=depth_limit, type=int)
+    max_nodes = request.args.get('max_nodes', default=node_limit, type=int)
+    if max_depth < 0 or max_nodes < 1:
+        return jsonify({"error": "max_depth must be >= 0 and max_nodes must be >= 1"}), 400
+
+    tree = build_tree(user_id, min(max_depth, depth_limit), min(max_nodes, node_limit))
     if tree:
         return jsonify(tree)
     return jsonify({"error": "User not found"}), 404
 
+@main_bp.route('/kinship/<int:user_a>/<int:user_b>', methods=["GET"])
+@replica_read
+def get_kinship(user_a, user_b):
+    users = {u.id: u for u in User.query.filter(User.id.in_({user_a, user_b})).all()}
+    if user_a not in users or user_b not in users:
+        return jsonify({"error": "User not found"}), 404
+    if user_a == user_b:
+        return jsonify({"error": "Cannot compute kinship with yourself"}), 400
+
+    relatives, truncated = family_graph.walk(
+        user_a, current_app.config['KINSHIP_MAX_DEGREE'], current_app.config['KINSHIP_NODE_BUDGET']
+    )
+    path = family_graph.path_from_walk(relatives, user_a, user_b)
+    if path is None:
+        return jsonify({
+            "user_id": user_a,
+            "other_user_id": user_b,
+            "related": False,
+            "truncated": truncated
+        })
+
+    path_ids = [uid for uid, _ in path]
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_(path_ids)).all())
+    return jsonify({
+        "user_id": user_a,
+        "other_user_id": user_b,
+        "related": True,
+        "degree": relatives[user_b]["degree"],
+        "relationship": relatives[user_b]["relationship"],
+        "path": [{"id": uid, "name": names.get(uid), "relationship": label} for uid, label in path],
+        "truncated": truncated
+    })
+
+@main_bp.route('/path/<int:user_a>/<int:user_b>', methods=["GET"])
+@replica_read
+def get_relationship_path(user_a, user_b):
+    hop_limit = current_app.config['PATH_MAX_HOPS']
+    max_hops = request.args.get('max_hops', default=hop_limit, type=int)
+    if max_hops < 1:
+        return jsonify({"error": "max_hops must be >= 1"}), 400
+
+    users = dict(db.session.query(User.id, User.name).filter(User.id.in_({user_a, user_b})).all())
+    if user_a not in users or user_b not in users:
+        return jsonify({"error": "User not found"}), 404
+
+    path = family_graph.shortest_path(user_a, user_b, min(max_hops, hop_limit))
+    if path is None:
+        return jsonify({"user_id": user_a, "other_user_id": user_b, "related": False})
+
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_([uid for uid, _ in path])).all())
+    return jsonify({
+        "user_id": user_a,
+        "other_user_id": user_b,
+        "related": True,
+        "hops": len(path) - 1,
+        "relationship": compose_path([label for _, label in path[1:]]),
+        "path": [{"id": uid, "name": names.get(uid), "relationship": label} for uid, label in path]
+    })
+
+@main_bp.route('/extended_family/<int:user_id>', methods=["GET"])
+@replica_read
+def get_extended_family(user_id):
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    degree_limit = current_app.config['KINSHIP_MAX_DEGREE']
+    degree = request.args.get('degree', default=2, type=int)
+    if degree < 1:
+        return jsonify({"error": "degree must be >= 1"}), 400
+    degree = min(degree, degree_limit)
+
+    relatives, truncated = family_graph.walk(user_id, degree, current_app.config['KINSHIP_NODE_BUDGET'])
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_(relatives)).all()) if relatives else {}
+
+    results = []
+    for relative_id, entry in sorted(relatives.items(), key=lambda item: (item[1]["degree"], item[0])):
+        if relative_id not in names:
+            continue
+        results.append({
+            "id": relative_id,
+            "name": names[relative_id],
+            "degree": entry["degree"],
+            "relationship": entry["relationship"],
+            "via": entry["parent"] if entry["parent"] != user_id else None
+        })
+
+    return jsonify({"user_id": user_id, "degree": degree, "relatives": results, "truncated": truncated})
+
 @main_bp.route('/delete_user/<int:user_id>', methods=["DELETE"])
+@acts_as('user_id')
 def delete_user(user_id):
     user = User.query.get(user_id)
     if not user:
         return jsonify({"error": "User not found"}), 404
 
+    # Pending requests this user sent no longer count towards the recipients' badges
+    pending_sent = db.session.query(Relationship.to_user_id, db.func.count(Relationship.id)).filter(
+        (Relationship.from_user_id == user_id) & (Relationship.status == 'pending')
+    ).group_by(Relationship.to_user_id).all()
+    for to_user_id, count in pending_sent:
+        adjust_counters(to_user_id, pending_requests=-count)
+    UserCounters.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
     # Delete any relationships this user is involved in
     Relationship.query.filter(
         (Relationship.from_user_id == user_id) |
         (Relationship.to_user_id == user_id)
     ).delete(synchronize_session=False)
 
+    # Nor do unread messages from this user, once their partners' summaries are gone
+    unread_from_user = db.session.query(ConversationSummary.user_id, ConversationSummary.unread_count).filter(
+        ConversationSummary.partner_id == user_id, ConversationSummary.unread_count > 0
+    ).order_by(ConversationSummary.user_id).all()
+    for partner_id, unread in unread_from_user:
+        adjust_counters(partner_id, unread_messages=-unread)
+    delete_user_conversations(user_id)
+    session_cache.revoke_user(user_id)
+
     # Delete the user
     db.session.delete(user)
     db.session.commit()
+    family_graph.remove_user(user_id)
+    profile_cache.invalidate(user_id)
+    response_cache.bump_all()
 
     return jsonify({"message": f"User with ID {user_id} deleted."})
 
 @main_bp.route('/relationship_requests/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
 def get_relationship_requests(user_id):
     # Pending requests TO this user
-    requests = Relationship.query.filter_by(to_user_id=user_id, status='pending').all()
+    requests = Relationship.query.options(joinedload(Relationship.from_user)).filter_by(
+        to_user_id=user_id, status='pending'
+    ).all()
     results = []
     for rel in requests:
-        from_user = User.query.get(rel.from_user_id)
+        from_user = rel.from_user
         if from_user:
             results.append({
                 "request_id": rel.id,
                 "from_user_id": from_user.id,
                 "from_name": from_user.name,
-                "from_profile_pic": from_user.profile_pic,
-                "relationship": rel.relationship_type
+                "from_profile_pic": avatar_url(from_user),
+                "relationship": rel.relationship_type,
+                "suggested_reverse_relationship": get_reverse_relationship(
+                    rel.relationship_type, from_user.gender
+                )
             })
     return jsonify(results)
 
@@ -266,22 +479,41 @@ def respond_relationship(request_id):
     rel = Relationship.query.get(request_id)
     if not rel:
         return jsonify({"error": "Request not found"}), 404
+    error = identity_error(rel.to_user_id)
+    if error:
+        return error
 
     data = request.json
     if "status" in data and data["status"] in ["approved", "declined"]:
+        was_pending = rel.status == 'pending'
+
         if data["status"] == "approved":
-            # For approval, we need the reverse relationship type
-            if "reverse_relationship_type" not in data or not data["reverse_relationship_type"]:
+            # For approval we need the reverse relationship type; infer it when not given
+            reverse_type = data.get("reverse_relationship_type")
+            if not reverse_type and rel.from_user:
+                reverse_type = get_reverse_relationship(
+                    rel.relationship_type, rel.from_user.gender, rel.to_user.gender if rel.to_user else None
+                )
+            if not reverse_type:
                 return jsonify({"error": "Reverse relationship type is required for approval"}), 400
 
             rel.status = "approved"
-            rel.reverse_relationship_type = data["reverse_relationship_type"]
+            rel.reverse_relationship_type = reverse_type
             rel.is_bidirectional = True
         else:
             # If declined, we can just mark it as declined
             rel.status = "declined"
 
+        if was_pending:
+            adjust_counters(rel.to_user_id, pending_requests=-1)
         db.session.commit()
+        family_graph.update(rel)
+        relationship_changed(rel)
+        event_hub.publish(rel.from_user_id, "relationship_response", {
+            "request_id": rel.id,
+            "to_user_id": rel.to_user_id,
+            "status": rel.status
+        })
         return jsonify({"message": f"Request {data['status']}"})
 
     return jsonify({"error": "Invalid status or missing data"}), 400
@@ -294,10 +526,13 @@ def edit_relationship(relationship_id):
         return jsonify({"error": "Relationship not found"}), 404
 
     data = request.json
-    if "new_relationship_type" not in data or "requesting_user_id" not in data:
+    requesting_user_id = data.get("requesting_user_id", g.get("user_id"))
+    if "new_relationship_type" not in data or requesting_user_id is None:
         return jsonify({"error": "Missing required fields"}), 400
+    error = identity_error(requesting_user_id)
+    if error:
+        return error
 
-    requesting_user_id = data["requesting_user_id"]
     new_relationship_type = data["new_relationship_type"]
 
     # Determine which user is making the change and apply it directly
@@ -312,20 +547,32 @@ def edit_relationship(relationship_id):
     # For now, we will just commit the change directly.
 
     db.session.commit()
+    family_graph.update(rel)
+    relationship_changed(rel)
+    other_user_id = rel.to_user_id if requesting_user_id == rel.from_user_id else rel.from_user_id
+    event_hub.publish(other_user_id, "relationship_edited", {
+        "relationship_id": rel.id,
+        "edited_by": requesting_user_id,
+        "new_relationship_type": new_relationship_type
+    })
 
     return jsonify({"message": "Relationship updated successfully!"})
 
 @main_bp.route('/relationship_edit_requests/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
 def get_relationship_edit_requests(user_id):
     """Get pending relationship edit requests for a user"""
-    requests = RelationshipEditRequest.query.filter_by(
+    requests = RelationshipEditRequest.query.options(
+        joinedload(RelationshipEditRequest.requesting_user)
+    ).filter_by(
         target_user_id=user_id,
         status='pending'
     ).all()
 
     results = []
     for req in requests:
-        requesting_user = User.query.get(req.requesting_user_id)
+        requesting_user = req.requesting_user
         if requesting_user:
             results.append({
                 "request_id": req.id,
@@ -344,11 +591,15 @@ def respond_edit_request(request_id):
     edit_req = RelationshipEditRequest.query.get(request_id)
     if not edit_req:
         return jsonify({"error": "Edit request not found"}), 404
+    error = identity_error(edit_req.target_user_id)
+    if error:
+        return error
 
     data = request.json
     if "status" not in data or data["status"] not in ["approved", "declined"]:
         return jsonify({"error": "Invalid status"}), 400
 
+    rel = None
     if data["status"] == "approved":
         # Apply the relationship change
         rel = Relationship.query.get(edit_req.relationship_id)
@@ -357,21 +608,30 @@ def respond_edit_request(request_id):
                 rel.relationship_type = edit_req.new_relationship_type
             else:
                 rel.reverse_relationship_type = edit_req.new_relationship_type
-            db.session.commit()
 
-    # Mark the edit request as processed
+    if edit_req.status == 'pending':
+        adjust_counters(edit_req.target_user_id, pending_edit_requests=-1)
+
+    # Mark the edit request as processed, in the same transaction as the change
     edit_req.status = data["status"]
     db.session.commit()
+    if rel:
+        family_graph.update(rel)
+        relationship_changed(rel)
 
     return jsonify({"message": f"Edit request {data['status']}"})
 
 @main_bp.route('/connect_requests_sent/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
 def get_sent_connect_requests(user_id):
     # Pending requests sent by this user
-    requests = Relationship.query.filter_by(from_user_id=user_id, status='pending').all()
+    requests = Relationship.query.options(joinedload(Relationship.to_user)).filter_by(
+        from_user_id=user_id, status='pending'
+    ).all()
     results = []
     for rel in requests:
-        to_user = User.query.get(rel.to_user_id)
+        to_user = rel.to_user
         if to_user:
             results.append({
                 "request_id": rel.id,
@@ -382,207 +642,348 @@ def get_sent_connect_requests(user_id):
     return jsonify(results)
 
 @main_bp.route('/profile/<int:user_id>', methods=["GET"])
+@replica_read
+@cached_response(lambda user_id: [user_key(user_id)])
 def get_user_profile(user_id):
     """Get a user's profile, respecting privacy settings"""
     try:
-        target_user = User.query.get(user_id)
-        if not target_user:
-            return jsonify({"error": "User not found"}), 404
+        # The viewer is the signed-in user, or the requesting_user_id query parameter
+        requesting_user_id = request.args.get('requesting_user_id', g.get('user_id'), type=int)
 
-        # Get the requesting user's ID from query parameter
-        requesting_user_id = request.args.get('requesting_user_id', type=int)
+        profile = profile_cache.get(user_id)
+        if not profile:
+            return jsonify({"error": "User not found"}), 404
         if requesting_user_id is None:
             return jsonify({"error": "Missing or invalid requesting_user_id"}), 400
+        error = identity_error(requesting_user_id)
+        if error:
+            return error
 
-        # Check if users are connected (if not the same user)
-        is_connected = False
-        is_own_profile = requesting_user_id == user_id
-
-        if requesting_user_id and not is_own_profile:
-            # Check if there's an approved relationship between the users (bidirectional only)
-            relationship = Relationship.query.filter(
-                (((Relationship.from_user_id == requesting_user_id) & (Relationship.to_user_id == user_id)) |
-                 ((Relationship.from_user_id == user_id) & (Relationship.to_user_id == requesting_user_id))) &
-                (Relationship.status == 'approved') &
-                (Relationship.is_bidirectional == True)
-            ).first()
-            is_connected = relationship is not None
-
-        # Build response based on privacy settings and connection status
-        profile_data = {
-            "id": target_user.id,
-            "name": target_user.name,
-            "email": target_user.email if (is_own_profile or is_connected) else None,
-            "profile_pic": target_user.profile_pic
-        }
-
-        # Add fields based on privacy settings
-        if is_own_profile:
-            # Own profile - show everything including privacy settings
-            profile_data.update({
-                "phone": target_user.phone,
-                "job": target_user.job,
-                "bio": target_user.bio,
-                "location": target_user.location,
-                "phone_private": target_user.phone_private,
-                "job_private": target_user.job_private,
-                "bio_private": target_user.bio_private,
-                "location_private": target_user.location_private,
-                "is_own_profile": True,
-                "is_connected": True
-            })
-        else:
-            # Other user's profile - show all fields to connections, respect privacy for non-connections
-            profile_data.update({
-                "phone": target_user.phone if is_connected or not target_user.phone_private else None,
-                "job": target_user.job if is_connected or not target_user.job_private else None,
-                "bio": target_user.bio if is_connected or not target_user.bio_private else None,
-                "location": target_user.location if is_connected or not target_user.location_private else None,
-                "phone_private": target_user.phone_private,
-                "job_private": target_user.job_private,
-                "bio_private": target_user.bio_private,
-                "location_private": target_user.location_private,
-                "is_own_profile": False,
-                "is_connected": is_connected
-            })
-
-        return jsonify(profile_data)
+        # Own profile shows everything, connections see private fields, everyone else only public ones
+        return jsonify(view_profile(profile, requesting_user_id))
     except Exception as e:
         import traceback
         print(f"Error in get_user_profile: {str(e)}\n{traceback.format_exc()}")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+@main_bp.route('/profiles', methods=["GET"])
+@replica_read
+def get_profiles():
+    """Get several profiles in one request, e.g. /profiles?ids=1,2,3&requesting_user_id=4"""
+    requesting_user_id = request.args.get('requesting_user_id', g.get('user_id'), type=int)
+    if requesting_user_id is None:
+        return jsonify({"error": "Missing or invalid requesting_user_id"}), 400
+    error = identity_error(requesting_user_id)
+    if error:
+        return error
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of user ids"}), 400
+    if not ids:
+        return jsonify({"error": "ids is required"}), 400
+    if len(ids) > current_app.config['PROFILE_BATCH_MAX']:
+        return jsonify({"error": f"At most {current_app.config['PROFILE_BATCH_MAX']} ids per request"}), 400
+
+    profiles = profile_cache.get_many(ids)
+    return jsonify({
+        "profiles": [view_profile(profiles[i], requesting_user_id) for i in ids if i in profiles],
+        "missing": [i for i in ids if i not in profiles]
+    })
+
 # Messaging Routes
 @main_bp.route('/send_message', methods=["POST"])
 def send_message():
     """Send a message to another user"""
     data = request.json
-    if not all(key in data for key in ['sender_id', 'recipient_id', 'content']):
+    # The family graph is keyed by int, so "2" must become 2 before are_connected
+    try:
+        sender_id = int_field(data, 'sender_id', g.get('user_id'))
+        recipient_id = int_field(data, 'recipient_id')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if sender_id is None or recipient_id is None or 'content' not in data:
         return jsonify({"error": "Missing required fields"}), 400
+    error = identity_error(sender_id)
+    if error:
+        return error
 
-    sender_id = data['sender_id']
-    recipient_id = data['recipient_id']
     content = data['content'].strip()
 
     if not content:
         return jsonify({"error": "Message content cannot be empty"}), 400
 
     # Check if users are connected
-    relationship = Relationship.query.filter(
-        (((Relationship.from_user_id == sender_id) & (Relationship.to_user_id == recipient_id)) |
-         ((Relationship.from_user_id == recipient_id) & (Relationship.to_user_id == sender_id))) &
-        (Relationship.status == 'approved') &
-        (Relationship.is_bidirectional == True)
-    ).first()
-
-    if not relationship:
+    if not family_graph.are_connected(sender_id, recipient_id):
         return jsonify({"error": "You can only message people you're connected with"}), 403
 
-    # Create the message
-    message = Message(
-        sender_id=sender_id,
-        recipient_id=recipient_id,
-        content=content
-    )
-    
-    db.session.add(message)
-    db.session.commit()
+    # Group-committed with other senders' messages; returns once ours is durable
+    try:
+        message = message_writer.submit(sender_id, recipient_id, content)
+    except WriterBusy:
+        return jsonify({"error": "Server busy, please try again"}), 503
+    except WriterTimeout:
+        # Not safe to retry blindly: the message may still commit
+        return jsonify({"error": "Message may not have been sent; check the conversation before resending"}), 504
+    response_cache.bump(user_key(sender_id), user_key(recipient_id))
+    event_hub.publish(recipient_id, "message", serialize_message(message, recipient_id))
+    event_hub.publish(sender_id, "message", serialize_message(message, sender_id))
 
     return jsonify({"message": "Message sent successfully!"})
 
 @main_bp.route('/conversations/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
+@cached_response(lambda user_id: [user_key(user_id)])
 def get_conversations(user_id):
-    """Get all conversations for a user"""
-    # Get all messages where user is sender or recipient
-    messages = Message.query.filter(
-        or_(Message.sender_id == user_id, Message.recipient_id == user_id)
-    ).order_by(Message.timestamp.desc()).all()
-
-    # Group by conversation partner
-    conversations = {}
-    for message in messages:
-        other_user_id = message.recipient_id if message.sender_id == user_id else message.sender_id
-        
-        if other_user_id not in conversations:
-            other_user = User.query.get(other_user_id)
-            conversations[other_user_id] = {
-                "user_id": other_user_id,
-                "user_name": other_user.name,
-                "profile_pic": other_user.profile_pic,
-                "last_message": message.content,
-                "last_message_time": message.timestamp.isoformat(),
-                "is_last_message_from_me": message.sender_id == user_id,
-                "unread_count": 0
-            }
-
-    # Count unread messages for each conversation
-    for conv_user_id in conversations:
-        unread_count = Message.query.filter(
-            and_(
-                Message.sender_id == conv_user_id,
-                Message.recipient_id == user_id,
-                Message.is_read == False
-            )
-        ).count()
-        conversations[conv_user_id]["unread_count"] = unread_count
-
-    return jsonify(list(conversations.values()))
+    """
+    Get a page of a user's conversations, most recent first.
+    Reads the maintained conversation summaries, so the cost depends on the page size only.
+    """
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', default=current_app.config['CONVERSATION_PAGE_SIZE'], type=int)
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, current_app.config['CONVERSATION_PAGE_MAX'])
+
+    query = ConversationSummary.query.options(
+        joinedload(ConversationSummary.partner),
+        joinedload(ConversationSummary.last_message)
+    ).filter(ConversationSummary.user_id == user_id)
+    if before is not None:
+        query = query.filter(ConversationSummary.last_message_id < before)
+    summaries = query.order_by(ConversationSummary.last_message_id.desc()).limit(limit).all()
+
+    conversations = []
+    for summary in summaries:
+        other_user = summary.partner
+        message = summary.last_message
+        if not other_user or not message:
+            continue
+        conversations.append({
+            "user_id": other_user.id,
+            "user_name": other_user.name,
+            "profile_pic": avatar_url(other_user),
+            "last_message": message.content,
+            "last_message_time": message.timestamp.isoformat(),
+            "is_last_message_from_me": message.sender_id == user_id,
+            "unread_count": summary.unread_count
+        })
+
+    return jsonify({
+        "conversations": conversations,
+        "next_cursor": summaries[-1].last_message_id if len(summaries) == limit else None
+    })
+
+@main_bp.route('/messages/search/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
+def search_user_messages(user_id):
+    """Full-text search over the conversations a user is part of, best match first, one page at a time"""
+    query = request.args.get('q', '').strip()
+    other_user_id = request.args.get('other_user_id', type=int)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', default=20, type=int)
+    if not query:
+        return jsonify({"error": "Provide q"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, current_app.config['MESSAGE_SEARCH_MAX_LIMIT'])
+
+    # The cursor is the last match's "score:id"
+    after = None
+    if cursor:
+        try:
+            score, _, message_id = cursor.rpartition(':')
+            after = (float(score), int(message_id))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    matches = search_messages(user_id, query, other_user_id, after, limit)
+    if matches is None:
+        return jsonify({"error": "q has no searchable words"}), 400
+
+    return jsonify({
+        "results": [{
+            "id": m.id,
+            "sender_id": m.sender_id,
+            "recipient_id": m.recipient_id,
+            "other_user_id": m.recipient_id if m.sender_id == user_id else m.sender_id,
+            "timestamp": m.timestamp.isoformat(),
+            "snippet": m.snippet,
+            "is_from_me": m.sender_id == user_id
+        } for m in matches],
+        "next_cursor": f"{matches[-1].score!r}:{matches[-1].id}" if len(matches) == limit else None
+    })
 
 @main_bp.route('/messages/<int:user_id>/<int:other_user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
 def get_messages(user_id, other_user_id):
-    """Get all messages between two users"""
-    # Mark messages from other user as read
-    Message.query.filter(
-        and_(
-            Message.sender_id == other_user_id,
-            Message.recipient_id == user_id,
-            Message.is_read == False
-        )
-    ).update({Message.is_read: True})
-    db.session.commit()
+    """
+    Get one page of messages between two users, in chronological order.
 
-    # Get all messages between the two users
-    messages = Message.query.filter(
-        or_(
-            and_(Message.sender_id == user_id, Message.recipient_id == other_user_id),
-            and_(Message.sender_id == other_user_id, Message.recipient_id == user_id)
-        )
-    ).order_by(Message.timestamp.asc()).all()
+    By default returns the newest `limit` messages; `before_id` pages back through
+    older history and `after_id` returns only messages newer than that id. Reading
+    doesn't mark anything read; clients POST /mark_read for that.
+    """
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', default=current_app.config['MESSAGE_PAGE_SIZE'], type=int)
+    if before_id is not None and after_id is not None:
+        return jsonify({"error": "Use either before_id or after_id, not both"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, current_app.config['MESSAGE_PAGE_MAX'])
 
     # Get the other user's info
-    other_user = User.query.get(other_user_id)
+    other_user = db.session.get(User, other_user_id)
     if not other_user:
         return jsonify({"error": "User not found"}), 404
 
-    message_list = []
-    for message in messages:
-        message_list.append({
-            "id": message.id,
-            "sender_id": message.sender_id,
-            "recipient_id": message.recipient_id,
-            "content": message.content,
-            "timestamp": message.timestamp.isoformat(),
-            "is_read": message.is_read,
-            "is_from_me": message.sender_id == user_id
-        })
+    # Walk the (pair, id) index from the requested cursor, fetching one extra row to detect more pages.
+    # Archived messages are all older than the conversation's hot ones.
+    query = Message.query.filter(conversation_filter(user_id, other_user_id))
+    if after_id is not None:
+        rows = archived_after(user_id, other_user_id, after_id, limit + 1)
+        if len(rows) <= limit:
+            rows += query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1 - len(rows)).all()
+        has_more = len(rows) > limit
+        messages = rows[:limit]
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        if len(rows) <= limit:
+            # Scrolled past the hot range: carry on into the archive
+            cursor = rows[-1].id if rows else before_id
+            rows += archived_before(user_id, other_user_id, cursor, limit + 1 - len(rows))
+        has_more = len(rows) > limit
+        messages = rows[:limit][::-1]
+
+    # Both read watermarks: which incoming messages the viewer has read, and which of
+    # the viewer's own the other user has (read receipts)
+    last_read = read_watermarks(user_id, other_user_id)
+    message_list = [serialize_message(message, user_id, last_read) for message in messages]
 
     return jsonify({
         "other_user": {
             "id": other_user.id,
             "name": other_user.name,
-            "profile_pic": other_user.profile_pic
+            "profile_pic": avatar_url(other_user)
         },
-        "messages": message_list
+        "messages": message_list,
+        "has_more": has_more
     })
 
+@main_bp.route('/mark_read', methods=["POST"])
+def mark_messages_read():
+    """
+    Mark a conversation read up to up_to_id (default: its latest message) by moving the
+    reader's watermark. Writes one summary row however many messages that covers.
+    """
+    data = request.json
+    try:
+        user_id = int_field(data, 'user_id', g.get('user_id'))
+        other_user_id = int_field(data, 'other_user_id')
+        up_to_id = int_field(data, 'up_to_id')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if user_id is None or other_user_id is None:
+        return jsonify({"error": "Missing required fields"}), 400
+    error = identity_error(user_id)
+    if error:
+        return error
+
+    marked, last_read_id = mark_read(user_id, other_user_id, up_to_id)
+    adjust_counters(user_id, unread_messages=-marked)
+    db.session.commit()
+    if marked:
+        response_cache.bump(user_key(user_id))
+        read = {"user_id": user_id, "last_read_id": last_read_id, "other_user_id": other_user_id}
+        event_hub.publish(other_user_id, "read", read)
+        # The reader's own tabs too, so their unread badges catch up
+        event_hub.publish(user_id, "read", read)
+
+    return jsonify({"marked": marked, "last_read_id": last_read_id})
+
 @main_bp.route('/unread_message_count/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
 def get_unread_message_count(user_id):
     """Get total unread message count for a user"""
-    count = Message.query.filter(
-        and_(
-            Message.recipient_id == user_id,
-            Message.is_read == False
-        )
-    ).count()
-    
-    return jsonify({"unread_count": count})
+    return jsonify({"unread_count": get_badges(user_id)["unread_messages"]})
+
+@main_bp.route('/badges/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
+def get_user_badges(user_id):
+    """Unread message and pending request counts for the menu badges, from maintained counters"""
+    return jsonify(get_badges(user_id))
+
+@main_bp.route('/events/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+def get_events(user_id):
+    """
+    Server-sent event stream of changes affecting a user: new messages, connection
+    requests and responses, and relationship edits. Idle streams touch no database,
+    but each holds a server thread, so at most EVENT_STREAM_MAX are open per process.
+    """
+    q = event_hub.subscribe(user_id, current_app.config['EVENT_STREAM_MAX'])
+    if q is None:
+        return jsonify({"error": "Too many open event streams, please try again later"}), 503, {"Retry-After": "30"}
+    response = Response(
+        stream_events(q, current_app.config['EVENT_STREAM_HEARTBEAT_SECONDS']),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(lambda: event_hub.unsubscribe(user_id, q))
+    return response
+
+@main_bp.route('/import/relationships', methods=["POST"])
+def import_relationships_route():
+    """
+    Bulk-import the signed-in user's relationships from a CSV or GEDCOM upload (request
+    body or a multipart "file" field). The upload is parsed as it is read and inserted in
+    chunked transactions. Everything is created as a pending request for the other user
+    to answer; approving on import is only available from `flask import-relationships`.
+    """
+    if g.get('user_id') is None:
+        return jsonify({"error": "Authentication required"}), 401
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'gedcom'):
+        return jsonify({"error": "format must be csv or gedcom"}), 400
+    if request.args.get('approve', 'false').lower() == 'true':
+        return jsonify({"error": "approve is only available from flask import-relationships"}), 403
+
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    links = parse_csv(lines) if fmt == 'csv' else parse_gedcom(lines)
+
+    try:
+        summary = import_relationships(links, False, current_app.config['IMPORT_CHUNK_SIZE'], g.user_id)
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({"error": f"Could not parse upload: {e}"}), 400
+    except IntegrityError:
+        # Other requests kept linking the same pairs; a retry skips what's already in
+        db.session.rollback()
+        return jsonify({"error": "Relationships changed during the import, please try again"}), 409
+    finally:
+        # Chunks committed before a parse error are in the database too
+        response_cache.bump_all()
+    return jsonify(summary)
+
+@main_bp.route('/export/<int:user_id>', methods=["GET"])
+@acts_as('user_id')
+@replica_read
+def export_family(user_id):
+    """Stream the user's connected family as CSV (the format /import/relationships accepts)"""
+    if not db.session.get(User, user_id):
+        return jsonify({"error": "User not found"}), 404
+    return Response(
+        stream_with_context(export_tree_csv(user_id)),
+        mimetype='text/csv',
+        headers={"Content-Disposition": f"attachment; filename=family_{user_id}.csv"}
+    )
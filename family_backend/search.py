@@ -0,0 +1,209 @@
+import html
+import re
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import event, or_, text
+from models import db, User, Message
+from archive import unpack_segment
+
+# Trigram FTS5 index over the searchable user columns, kept in sync by triggers.
+# The trigram tokenizer matches any substring of three or more characters.
+USER_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(
+        name, email, phone, content='user', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON user BEGIN
+        INSERT INTO user_search(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON user BEGIN
+        INSERT INTO user_search(user_search, rowid, name, email, phone)
+        VALUES ('delete', old.id, old.name, old.email, old.phone);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF name, email, phone ON user BEGIN
+        INSERT INTO user_search(user_search, rowid, name, email, phone)
+        VALUES ('delete', old.id, old.name, old.email, old.phone);
+        INSERT INTO user_search(rowid, name, email, phone) VALUES (new.id, new.name, new.email, new.phone);
+    END""",
+]
+USER_SEARCH_DROP = [
+    "DROP TRIGGER IF EXISTS user_search_au",
+    "DROP TRIGGER IF EXISTS user_search_ad",
+    "DROP TRIGGER IF EXISTS user_search_ai",
+    "DROP TABLE IF EXISTS user_search",
+]
+
+# Trigram matching needs at least this many characters
+MIN_TRIGRAM_QUERY = 3
+
+def create_user_search_index(connection):
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in USER_SEARCH_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO user_search(user_search) VALUES ('rebuild')"))
+
+def _fts_phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+def search_users(query, after_id=0, limit=20):
+    """
+    Return up to limit users whose name, email or phone contains query, ordered by id
+    and starting after after_id (keyset pagination).
+    """
+    if db.engine.dialect.name == 'sqlite' and len(query) >= MIN_TRIGRAM_QUERY:
+        ids = [row[0] for row in db.session.execute(
+            text(
+                "SELECT rowid FROM user_search WHERE user_search MATCH :q AND rowid > :after "
+                "ORDER BY rowid LIMIT :limit"
+            ),
+            {"q": _fts_phrase(query), "after": after_id, "limit": limit}
+        )]
+        if not ids:
+            return []
+        users = {u.id: u for u in User.query.filter(User.id.in_(ids)).all()}
+        return [users[i] for i in ids if i in users]
+
+    # Short queries (and other databases) fall back to a prefix match walked in id order
+    pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return User.query.filter(
+        User.id > after_id,
+        User.name.ilike(pattern, escape='\\') |
+        User.email.ilike(pattern, escape='\\') |
+        User.phone.like(pattern, escape='\\')
+    ).order_by(User.id).limit(limit).all()
+
+# Word-level FTS5 index over message text. Unlike user_search it stores its own copy of
+# each message rather than reading the message table, so messages stay searchable (with
+# snippets) after archive.py moves them out. Insert/update triggers keep it in sync with
+# send_message and bulk loads alike. `members` holds a "u<id>" token for each side of the
+# conversation, so scoping a search to one user is an index lookup, not a post-filter.
+MESSAGE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+        content, members, sender_id UNINDEXED, recipient_id UNINDEXED, timestamp UNINDEXED,
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS message_search_ai AFTER INSERT ON message BEGIN
+        INSERT INTO message_search(rowid, content, members, sender_id, recipient_id, timestamp)
+        VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.recipient_id,
+                new.sender_id, new.recipient_id, new.timestamp);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_search_au AFTER UPDATE OF content ON message BEGIN
+        UPDATE message_search SET content = new.content WHERE rowid = new.id;
+    END""",
+]
+MESSAGE_SEARCH_DROP = [
+    "DROP TRIGGER IF EXISTS message_search_au",
+    "DROP TRIGGER IF EXISTS message_search_ai",
+    "DROP TABLE IF EXISTS message_search",
+]
+
+# Marks matched terms in snippets; swapped for <mark> after the text is HTML-escaped
+_MATCH_START, _MATCH_END = '\ue000', '\ue001'
+SNIPPET_TOKENS = 12
+
+def create_message_search_index(connection):
+    """Create the index and fill it from the message table and the archive"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in MESSAGE_SEARCH_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("DELETE FROM message_search"))
+    connection.execute(text(
+        "INSERT INTO message_search(rowid, content, members, sender_id, recipient_id, timestamp) "
+        "SELECT id, content, 'u' || sender_id || ' u' || recipient_id, sender_id, recipient_id, timestamp "
+        "FROM message"
+    ))
+    for (data,) in connection.execute(text("SELECT data FROM message_archive")).all():
+        connection.execute(text(
+            "INSERT INTO message_search(rowid, content, members, sender_id, recipient_id, timestamp) "
+            "VALUES (:id, :content, :members, :sender_id, :recipient_id, :timestamp)"
+        ), [{
+            "id": m.id, "content": m.content, "members": f"u{m.sender_id} u{m.recipient_id}",
+            "sender_id": m.sender_id, "recipient_id": m.recipient_id,
+            "timestamp": m.timestamp.isoformat(sep=' ')
+        } for m in unpack_segment(data)])
+
+# One search hit; score is bm25 (lower is better), 0 from the fallback
+MessageMatch = namedtuple("MessageMatch", "id sender_id recipient_id timestamp snippet score")
+
+def _fts_terms(query):
+    """All of the query's words, the last one as a prefix so results follow typing"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(_fts_phrase(word) for word in words) + '*'
+
+def _highlight(snippet):
+    return html.escape(snippet).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+def search_messages(user_id, query, other_user_id=None, after=None, limit=20):
+    """
+    Return up to limit MessageMatches for query among the messages user_id sent or
+    received (optionally only those exchanged with other_user_id), archived ones
+    included, best match first. Snippets are HTML-escaped with matches in <mark>.
+    after is the (score, id) of the previous page's last match (keyset pagination);
+    scores shift a little as messages are added, so pages are best-effort under writes.
+    Returns None if query has no searchable words.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return _search_messages_fallback(user_id, query, other_user_id, after, limit)
+
+    terms = _fts_terms(query)
+    if terms is None:
+        return None
+    match = f'members:"u{user_id}"'
+    if other_user_id is not None:
+        match += f' AND members:"u{other_user_id}"'
+    match += f' AND content:({terms})'
+
+    # Only the content column counts towards the score
+    score = "bm25(message_search, 1.0, 0.0)"
+    sql = (
+        f"SELECT rowid, sender_id, recipient_id, timestamp, "
+        f"snippet(message_search, 0, :start, :end, '…', :tokens), {score} AS score "
+        f"FROM message_search WHERE message_search MATCH :q"
+    )
+    params = {"q": match, "start": _MATCH_START, "end": _MATCH_END, "tokens": SNIPPET_TOKENS, "limit": limit}
+    if after is not None:
+        sql += f" AND ({score} > :score OR ({score} = :score AND rowid < :after_id))"
+        params["score"], params["after_id"] = after
+    sql += " ORDER BY score, rowid DESC LIMIT :limit"
+
+    return [
+        MessageMatch(message_id, sender_id, recipient_id, datetime.fromisoformat(timestamp), _highlight(snippet), match_score)
+        for message_id, sender_id, recipient_id, timestamp, snippet, match_score in db.session.execute(text(sql), params)
+    ]
+
+def _search_messages_fallback(user_id, query, other_user_id, after, limit):
+    # Other databases: a substring scan of the user's hot messages, newest first
+    query = query.strip()
+    if not query:
+        return None
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    messages = Message.query.filter(
+        or_(Message.sender_id == user_id, Message.recipient_id == user_id),
+        Message.content.ilike(pattern, escape='\\')
+    )
+    if other_user_id is not None:
+        messages = messages.filter(or_(Message.sender_id == other_user_id, Message.recipient_id == other_user_id))
+    if after is not None:
+        messages = messages.filter(Message.id < after[1])
+
+    matches = []
+    for message in messages.order_by(Message.id.desc()).limit(limit):
+        content = message.content
+        at = content.lower().find(query.lower())
+        end = at + len(query)
+        start, stop = max(0, at - 40), end + 40
+        snippet = ('…' if start else '') + content[start:at] + _MATCH_START + content[at:end] + _MATCH_END + \
+            content[end:stop] + ('…' if stop < len(content) else '')
+        matches.append(MessageMatch(message.id, message.sender_id, message.recipient_id,
+                                    message.timestamp, _highlight(snippet), 0.0))
+    return matches
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_tables(target, connection, **kw):
+    # Keeps db.create_all() (init_db.py) in step with the migrations
+    create_user_search_index(connection)
+    create_message_search_index(connection)
+
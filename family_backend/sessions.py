@@ -0,0 +1,151 @@
+import secrets
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import select
+from models import db, UserSession
+
+class SessionCache:
+    """
+    Issues signed session tokens and resolves them to user ids.
+
+    A token carries its session id and user id, signed with SECRET_KEY, so forged or
+    expired tokens are rejected without touching the database. A valid token is checked
+    against the user_session table once and then remembered in an in-process LRU for
+    `ttl` seconds. Logging out deletes the row and drops the entry here; other workers
+    stop accepting the token once their entry expires.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self._lock = Lock()
+        self._sessions = OrderedDict()  # token -> (user_id, checked_at), least recently used first
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def _serializer(self, salt="session"):
+        return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt=salt)
+
+    def issue(self, user_id):
+        """Start a session for user_id and return its token; the caller commits"""
+        session_id = secrets.token_hex(16)
+        db.session.add(UserSession(id=session_id, user_id=user_id))
+        return self._serializer().dumps({"sid": session_id, "uid": user_id})
+
+    def resolve(self, token):
+        """The user id a token belongs to, or None if it is invalid, expired or revoked"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._sessions.move_to_end(token)
+                return entry[0]
+
+        try:
+            data = self._serializer().loads(token, max_age=current_app.config["SESSION_MAX_AGE"])
+        except BadSignature:
+            return None
+        # A session may have been created a moment ago, so read the primary rather than a replica
+        with db.engine.connect() as connection:
+            user_id = connection.execute(
+                select(UserSession.user_id).where(UserSession.id == data["sid"])
+            ).scalar()
+
+        with self._lock:
+            if user_id is None:
+                self._sessions.pop(token, None)
+                return None
+            self._sessions[token] = (user_id, now)
+            self._sessions.move_to_end(token)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return user_id
+
+    def issue_ticket(self, token):
+        """A short-lived ticket for opening an /events stream under the same session as token"""
+        data = self._serializer().loads(token)
+        return self._serializer("stream-ticket").dumps(data)
+
+    def resolve_ticket(self, ticket):
+        """The user id a stream ticket belongs to, or None if it is invalid, expired or its session revoked"""
+        try:
+            data = self._serializer("stream-ticket").loads(ticket, max_age=current_app.config["STREAM_TICKET_MAX_AGE"])
+        except BadSignature:
+            return None
+        # Checked on every use, so a logout also ends streams opened with its tickets
+        with db.engine.connect() as connection:
+            return connection.execute(
+                select(UserSession.user_id).where(UserSession.id == data["sid"])
+            ).scalar()
+
+    def revoke(self, token):
+        """End the session a token belongs to; the caller commits"""
+        try:
+            data = self._serializer().loads(token)
+        except BadSignature:
+            return
+        UserSession.query.filter_by(id=data["sid"]).delete(synchronize_session=False)
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def revoke_user(self, user_id):
+        """End every session of a user, e.g. when the account is deleted; the caller commits"""
+        UserSession.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        with self._lock:
+            for token in [t for t, (uid, _) in self._sessions.items() if uid == user_id]:
+                del self._sessions[token]
+
+session_cache = SessionCache()
+
+def request_token():
+    """The session token from the Authorization header"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+    return None
+
+def load_current_user():
+    """
+    before_request hook: resolve the request's token to g.user_id once per request.
+    EventSource can't set headers, so /events takes a short-lived ?ticket= instead
+    (POST /auth/stream_ticket); session tokens never appear in URLs or access logs.
+    """
+    g.user_id = None
+    token = request_token()
+    if token:
+        g.user_id = session_cache.resolve(token)
+    elif request.endpoint == "main.get_events" and request.args.get("ticket"):
+        g.user_id = session_cache.resolve_ticket(request.args["ticket"])
+    else:
+        return
+    if g.user_id is None:
+        return jsonify({"error": "Invalid or expired session"}), 401
+
+def identity_error(*allowed_ids):
+    """
+    An error response if the signed-in user is none of allowed_ids, else None.
+    Requests without a token are let through, acting as whoever they name, unless
+    AUTH_REQUIRED is set.
+    """
+    user_id = g.get("user_id")
+    if user_id is None:
+        if current_app.config["AUTH_REQUIRED"]:
+            return jsonify({"error": "Authentication required"}), 401
+        return None
+    if user_id not in allowed_ids:
+        return jsonify({"error": "Not allowed for this user"}), 403
+    return None
+
+def acts_as(view_arg):
+    """Only let the signed-in user use a view on their own behalf, e.g. @acts_as("user_id")"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            error = identity_error(view_args[view_arg])
+            if error:
+                return error
+            return view(**view_args)
+        return wrapper
+    return decorator
@@ -0,0 +1,95 @@
+import time
+from threading import Lock
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, ChangeStamp
+
+class SharedStamp:
+    """One change_stamp row: a version number for data this process keeps in memory"""
+
+    def __init__(self, state, key):
+        self.state = state
+        self.key = key
+        self.listeners = []  # Called to drop the local copy when another process changed the data
+        self.seen = None
+
+    def sync(self):
+        """Note the current version; call before (re)loading the data from the database"""
+        with db.engine.connect() as connection:
+            version = connection.execute(select(ChangeStamp.version).where(ChangeStamp.key == self.key)).scalar()
+        with self.state._lock:
+            self.seen = version or 0
+
+    def publish(self, always=False):
+        """
+        Tell other processes the data changed. Call after committing. Route writes only
+        publish with SHARED_STATE_SYNC on; always=True is for out-of-band changes such
+        as bulk imports, which a lone server process needs to hear about too.
+        """
+        if not (self.state.enabled or always):
+            return
+        for _ in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    version = connection.execute(
+                        update(ChangeStamp).where(ChangeStamp.key == self.key)
+                        .values(version=ChangeStamp.version + 1).returning(ChangeStamp.version)
+                    ).scalar()
+                    if version is None:
+                        connection.execute(insert(ChangeStamp).values(key=self.key, version=1))
+                        version = 1
+                break
+            except IntegrityError:
+                continue  # Another process created the row first; bump it instead
+        with self.state._lock:
+            # Our own bump needs no reload, unless someone else's slipped in before it
+            if self.seen is not None and version == self.seen + 1:
+                self.seen = version
+
+class SharedState:
+    """
+    Keeps per-process copies of shared data (the family graph, response and profile
+    caches) in step across server workers and CLI commands.
+
+    Each kind of data has a SharedStamp. A process publishes after committing a change
+    to the data, and check() (a before_request hook) reads every stamp in one query, at
+    most every check_interval seconds. A version this process didn't publish means
+    someone else changed the data, so the stamp's listeners drop their copies and they
+    are reloaded on next use. A change made in one worker therefore reaches the others
+    within check_interval seconds.
+    """
+
+    def __init__(self, enabled=False, check_interval=1.0):
+        self.enabled = enabled
+        self.check_interval = check_interval
+        self._stamps = {}
+        self._lock = Lock()
+        self._checked = 0.0
+
+    def configure(self, enabled, check_interval):
+        self.enabled = enabled
+        self.check_interval = check_interval
+
+    def stamp(self, key):
+        return self._stamps.setdefault(key, SharedStamp(self, key))
+
+    def check(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+        with db.engine.connect() as connection:
+            versions = dict(connection.execute(select(ChangeStamp.key, ChangeStamp.version)).all())
+        changed = []
+        with self._lock:
+            for key, stamp in self._stamps.items():
+                version = versions.get(key, 0)
+                if stamp.seen is not None and version != stamp.seen:
+                    changed.append(stamp)
+                stamp.seen = version
+        for stamp in changed:
+            for listener in stamp.listeners:
+                listener()
+
+shared_state = SharedState()
@@ -0,0 +1,140 @@
+from models import db, Relationship, User
+from kinship import compose_relationships
+
+# SQLite caps the number of bound parameters per statement, so large
+# frontiers are split into chunks before being used in an IN (...) clause.
+IN_CLAUSE_CHUNK = 500
+
+def _chunks(ids, size=IN_CLAUSE_CHUNK):
+    ids = list(ids)
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def _has_unvisited_children(frontier, users):
+    """True if any frontier user has an edge to a user the walk hasn't loaded"""
+    for chunk in _chunks(frontier):
+        to_ids = (
+            db.session.query(Relationship.to_user_id)
+            .join(User, User.id == Relationship.to_user_id)  # Edges to deleted users lead nowhere
+            .filter(Relationship.from_user_id.in_(chunk))
+            .distinct()
+        )
+        if any(to_id not in users for (to_id,) in to_ids):
+            return True
+    return False
+
+def load_subgraph(root_id, max_depth=None, max_nodes=None):
+    """
+    Load every user reachable from root_id by following from_user_id -> to_user_id
+    edges, one frontier (tree level) at a time.
+
+    Returns (users, children, truncated) where users maps id -> User, children maps
+    a parent id to a list of (child_id, relationship_type) and truncated is True if
+    max_depth or max_nodes stopped the walk before every reachable user was loaded.
+    Each level costs one relationship query and one user query (per chunk), so the
+    number of round trips grows with the depth of the tree, not with its size.
+    """
+    root = db.session.get(User, root_id)
+    if not root:
+        return None, None, False
+
+    users = {root.id: root}
+    children = {}
+    truncated = False
+    frontier = [root.id]
+    depth = 0
+
+    while frontier:
+        if max_depth is not None and depth >= max_depth:
+            # Only a cut if there was more to see; leaves at the limit aren't
+            truncated = _has_unvisited_children(frontier, users)
+            break
+
+        edges = []
+        for chunk in _chunks(frontier):
+            edges.extend(
+                db.session.query(
+                    Relationship.from_user_id,
+                    Relationship.to_user_id,
+                    Relationship.relationship_type
+                ).filter(Relationship.from_user_id.in_(chunk))
+                .order_by(Relationship.id)
+                .all()
+            )
+
+        # Keep the first edge that reaches each unseen user, in frontier order,
+        # until the node budget is spent.
+        next_frontier = []
+        pending = {}
+        order = {user_id: i for i, user_id in enumerate(frontier)}
+        edges.sort(key=lambda edge: order[edge[0]])
+        for from_id, to_id, relationship_type in edges:
+            if to_id in users or to_id in pending:
+                continue
+            if max_nodes is not None and len(users) + len(pending) >= max_nodes:
+                truncated = True
+                break
+            pending[to_id] = (from_id, relationship_type)
+
+        for chunk in _chunks(pending):
+            for user in User.query.filter(User.id.in_(chunk)).all():
+                users[user.id] = user
+
+        for to_id, (from_id, relationship_type) in pending.items():
+            # Edges pointing at users that no longer exist are skipped
+            if to_id in users:
+                children.setdefault(from_id, []).append((to_id, relationship_type))
+                next_frontier.append(to_id)
+
+        if truncated:
+            break
+
+        frontier = next_frontier
+        depth += 1
+
+    return users, children, truncated
+
+def build_tree(user_id, max_depth=None, max_nodes=None):
+    """
+    Build the nested family tree for user_id without recursion.
+
+    Every user appears at most once, attached under the shallowest relative that
+    links to them, so cycles in the relationship graph are harmless. Each relation also
+    carries implied_relationship: what the root user calls them, composed from the labels
+    along the path (e.g. father's brother -> Uncle), or None if it can't be named.
+    """
+    users, children, truncated = load_subgraph(user_id, max_depth, max_nodes)
+    if not users:
+        return None
+
+    nodes = {
+        uid: {"id": user.id, "name": user.name, "relations": []}
+        for uid, user in users.items()
+    }
+
+    # Walk parents before children so each node's implied label is known when its children need it
+    implied = {user_id: None}
+    queue = [user_id]
+    for parent_id in queue:
+        relations = nodes[parent_id]["relations"]
+        for child_id, relationship_type in children.get(parent_id, ()):
+            if parent_id == user_id:
+                implied[child_id] = relationship_type
+            elif implied[parent_id]:
+                implied[child_id] = compose_relationships(implied[parent_id], relationship_type)
+            else:
+                implied[child_id] = None
+            child = nodes[child_id]
+            relations.append({
+                "id": child["id"],
+                "name": child["name"],
+                "relationship": relationship_type,
+                "implied_relationship": implied[child_id],
+                "relations": child["relations"]
+            })
+            queue.append(child_id)
+
+    tree = nodes[user_id]
+    tree["node_count"] = len(nodes)
+    tree["truncated"] = truncated
+    return tree
@@ -9,6 +9,7 @@ import MyRelationships from './MyRelationships';
 import Messages from './Messages';
 import Chat from './Chat';
 import './App.css';
+import { apiFetch, clearSession, getCurrentUser, getSession, subscribeEvents } from './session';
 
 function Menu({ loggedIn, onLogout }) {
   const [pendingRequestsCount, setPendingRequestsCount] = useState(0);
@@ -18,39 +19,26 @@ function Menu({ loggedIn, onLogout }) {
 
   const fetchPendingRequests = async () => {
     try {
-      const email = localStorage.getItem('loggedInEmail');
-      setDebugInfo(`Checking requests for: ${email}`);
-
-      if (!email) {
-        setDebugInfo('No email found');
-        return;
-      }
-
-      // Get current user
-      const usersRes = await fetch('http://127.0.0.1:5000/users');
-      if (!usersRes.ok) {
-        setDebugInfo(`Users API failed: ${usersRes.status}`);
-        return;
-      }
-      const users = await usersRes.json();
-      const user = users.find(u => u.email === email);
-
+      // Current user from the session saved at login
+      const user = getCurrentUser();
       if (!user) {
-        setDebugInfo('User not found in database');
+        setDebugInfo('No session found');
         return;
       }
+      setDebugInfo(`Checking requests for: ${user.email}`);
       setCurrentUser(user);
 
-      // Get pending requests for this user using the correct endpoint
-      const requestsRes = await fetch(`http://127.0.0.1:5000/relationship_requests/${user.id}`);
-      if (!requestsRes.ok) {
-        setDebugInfo(`Requests API failed: ${requestsRes.status}`);
+      // Get badge counts for this user in one call
+      const badgesRes = await apiFetch(`http://127.0.0.1:5000/badges/${user.id}`);
+      if (!badgesRes.ok) {
+        setDebugInfo(`Badges API failed: ${badgesRes.status}`);
         return;
       }
-      const pendingRequests = await requestsRes.json();
+      const badges = await badgesRes.json();
 
-      setPendingRequestsCount(pendingRequests.length);
-      setDebugInfo(`Found ${pendingRequests.length} pending requests`);
+      setPendingRequestsCount(badges.pending_requests);
+      setUnreadMessageCount(badges.unread_messages);
+      setDebugInfo(`Found ${badges.pending_requests} pending requests`);
 
     } catch (error) {
       setDebugInfo(`Error: ${error.message}`);
@@ -61,10 +49,10 @@ function Menu({ loggedIn, onLogout }) {
     try {
       if (!currentUser) return;
 
-      const res = await fetch(`http://127.0.0.1:5000/unread_message_count/${currentUser.id}`);
+      const res = await apiFetch(`http://127.0.0.1:5000/badges/${currentUser.id}`);
       if (res.ok) {
         const data = await res.json();
-        setUnreadMessageCount(data.unread_count);
+        setUnreadMessageCount(data.unread_messages);
       }
     } catch (error) {
       console.error('Error fetching unread messages:', error);
@@ -80,10 +68,6 @@ function Menu({ loggedIn, onLogout }) {
     }
 
     fetchPendingRequests();
-    const interval = setInterval(() => {
-      fetchPendingRequests();
-      fetchUnreadMessages();
-    }, 30000);
 
     // Listen for request updates
     const handleRequestUpdate = () => {
@@ -94,11 +78,33 @@ function Menu({ loggedIn, onLogout }) {
     window.addEventListener('requestHandled', handleRequestUpdate);
 
     return () => {
-      clearInterval(interval);
       window.removeEventListener('requestHandled', handleRequestUpdate);
     };
   }, [loggedIn]);
 
+  // Server pushes changes instead of us polling for them
+  useEffect(() => {
+    if (!currentUser || !loggedIn) return;
+
+    const unsubscribes = [
+      subscribeEvents(currentUser.id, 'message', e => {
+        const msg = JSON.parse(e.data);
+        if (!msg.is_from_me) {
+          setUnreadMessageCount(count => count + 1);
+        }
+      }),
+      subscribeEvents(currentUser.id, 'relationship_request', () => {
+        setPendingRequestsCount(count => count + 1);
+      }),
+      // We read messages (maybe in this tab's open chat): the server has the new count
+      subscribeEvents(currentUser.id, 'read', e => {
+        if (JSON.parse(e.data).user_id === currentUser.id) fetchUnreadMessages();
+      })
+    ];
+
+    return () => unsubscribes.forEach(unsubscribe => unsubscribe());
+  }, [currentUser, loggedIn]);
+
   // Fetch unread messages when currentUser is available
   useEffect(() => {
     if (currentUser && loggedIn) {
@@ -172,15 +178,7 @@ function FindPeople() {
   ];
 
   useEffect(() => {
-    const email = localStorage.getItem('loggedInEmail');
-    if (email) {
-      fetch('http://127.0.0.1:5000/users')
-        .then(res => res.json())
-        .then(users => {
-          const user = users.find(u => u.email === email);
-          setCurrentUser(user);
-        });
-    }
+    setCurrentUser(getCurrentUser());
   }, []);
 
   const handleSearch = async e => {
@@ -188,9 +186,8 @@ function FindPeople() {
     setMessage('');
     setResults([]);
     if (!query) return;
-    const res = await fetch('http://127.0.0.1:5000/users');
-    const users = await res.json();
-    const found = users.filter(u => u.email === query || (u.phone && u.phone === query));
+    const res = await apiFetch(`http://127.0.0.1:5000/users/search?q=${encodeURIComponent(query)}`);
+    const { users: found = [] } = await res.json();
     setResults(found);
     if (found.length === 0) setMessage('No user found.');
   };
@@ -203,11 +200,10 @@ function FindPeople() {
       return;
     }
     
-    const res = await fetch('http://127.0.0.1:5000/connect', {
+    const res = await apiFetch('http://127.0.0.1:5000/connect', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
-        from_user_id: currentUser.id,
         to_user_id: toUserId,
         relationship_type: selectedRelationship
       })
@@ -311,15 +307,16 @@ function FindPeople() {
 }
 
 function App() {
-  const [loggedIn, setLoggedIn] = useState(!!localStorage.getItem('loggedInEmail'));
+  const [loggedIn, setLoggedIn] = useState(!!getSession());
   const navigate = useNavigate();
 
   useEffect(() => {
-    setLoggedIn(!!localStorage.getItem('loggedInEmail'));
+    setLoggedIn(!!getSession());
   }, []);
 
   const handleLogout = () => {
-    localStorage.removeItem('loggedInEmail');
+    apiFetch('http://127.0.0.1:5000/auth/logout', { method: 'POST' }).catch(() => {});
+    clearSession();
     setLoggedIn(false);
     navigate('/login');
   };
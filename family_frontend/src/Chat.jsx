@@ -1,6 +1,7 @@
 import { useEffect, useState, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import './App.css';
+import { apiFetch, getCurrentUser, subscribeEvents } from './session';
 
 function Chat() {
   const { userId } = useParams();
@@ -12,8 +13,9 @@ function Chat() {
   const [loading, setLoading] = useState(true);
   const [sending, setSending] = useState(false);
   const [message, setMessage] = useState('');
+  const [hasOlder, setHasOlder] = useState(false);
   const messagesEndRef = useRef(null);
-  const email = localStorage.getItem('loggedInEmail');
+  const sessionUser = getCurrentUser();
 
   const scrollToBottom = () => {
     setTimeout(() => {
@@ -21,30 +23,28 @@ function Chat() {
     }, 100);
   };
 
+  // Move our read watermark to the newest message in this conversation
+  const markRead = () => apiFetch('http://127.0.0.1:5000/mark_read', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ other_user_id: parseInt(userId) })
+  }).catch(() => {});
+
   const fetchUserAndMessages = async () => {
-    if (!email) return;
+    const user = sessionUser;
+    if (!user) return;
 
     try {
-      // Get current user
-      const usersRes = await fetch('http://127.0.0.1:5000/users');
-      const users = await usersRes.json();
-      const user = users.find(u => u.email === email);
-      
-      if (!user) return;
-      
-      // Check for updated profile picture in localStorage
-      const storedProfilePic = localStorage.getItem(`profile_pic_${user.email}`);
-      if (storedProfilePic) {
-        user.profile_pic = storedProfilePic;
-      }
       setCurrentUser(user);
 
       // Get messages between users
-      const messagesRes = await fetch(`http://127.0.0.1:5000/messages/${user.id}/${userId}`);
+      const messagesRes = await apiFetch(`http://127.0.0.1:5000/messages/${user.id}/${userId}`);
       if (messagesRes.ok) {
         const messagesData = await messagesRes.json();
         setMessages(messagesData.messages);
+        setHasOlder(messagesData.has_more);
         setOtherUser(messagesData.other_user);
+        markRead();
       } else {
         setMessage('Error loading messages');
       }
@@ -56,9 +56,42 @@ function Chat() {
     }
   };
 
+  // Append only messages newer than the last one we have
+  const fetchNewMessages = async () => {
+    const lastId = messages.length > 0 ? messages[messages.length - 1].id : 0;
+    const res = await apiFetch(`http://127.0.0.1:5000/messages/${currentUser.id}/${userId}?after_id=${lastId}`);
+    if (res.ok) {
+      const data = await res.json();
+      setMessages(prev => [...prev, ...data.messages.filter(m => !prev.some(p => p.id === m.id))]);
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    if (messages.length === 0) return;
+    const res = await apiFetch(`http://127.0.0.1:5000/messages/${currentUser.id}/${userId}?before_id=${messages[0].id}`);
+    if (res.ok) {
+      const data = await res.json();
+      setMessages(prev => [...data.messages, ...prev]);
+      setHasOlder(data.has_more);
+    }
+  };
+
   useEffect(() => {
     fetchUserAndMessages();
-  }, [email, userId]);
+  }, [sessionUser?.id, userId]);
+
+  // Append messages in this conversation as the server pushes them
+  useEffect(() => {
+    if (!currentUser) return;
+
+    return subscribeEvents(currentUser.id, 'message', e => {
+      const msg = JSON.parse(e.data);
+      const otherId = msg.is_from_me ? msg.recipient_id : msg.sender_id;
+      if (otherId !== parseInt(userId)) return;
+      setMessages(prev => (prev.some(m => m.id === msg.id) ? prev : [...prev, msg]));
+      if (!msg.is_from_me) markRead();
+    });
+  }, [currentUser, userId]);
 
   useEffect(() => {
     scrollToBottom();
@@ -73,19 +106,18 @@ function Chat() {
     setSending(true);
     
     try {
-      const res = await fetch('http://127.0.0.1:5000/send_message', {
+      const res = await apiFetch('http://127.0.0.1:5000/send_message', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
-          sender_id: currentUser.id,
           recipient_id: parseInt(userId),
           content: messageText
         })
       });
 
       if (res.ok) {
-        // Refresh messages
-        await fetchUserAndMessages();
+        // Fetch just the new messages (the event stream may already have delivered them)
+        await fetchNewMessages();
       } else {
         const data = await res.json();
         setMessage(data.error || 'Failed to send message');
@@ -206,6 +238,11 @@ function Chat() {
           </div>
         ) : (
           <>
+            {hasOlder && (
+              <button className="btn-secondary" onClick={loadOlderMessages} style={{alignSelf: 'center', marginBottom: '1rem'}}>
+                Load older messages
+              </button>
+            )}
             {messages.map((msg, index) => {
               const showDate =
                 index === 0 ||
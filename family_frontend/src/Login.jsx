@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
 import './AuthForm.css';
 import { useNavigate, Link } from 'react-router-dom';
+import { saveSession } from './session';
 
 function Login({ onLogin }) {
   const [form, setForm] = useState({ email: '', password: '' });
@@ -24,7 +25,7 @@ function Login({ onLogin }) {
       const data = await res.json();
 
       if (res.ok) {
-        localStorage.setItem("loggedInEmail", form.email);
+        saveSession(data.token, data.user);
         if (onLogin) onLogin();
         navigate('/profile');
       } else {
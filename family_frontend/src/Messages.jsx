@@ -1,36 +1,26 @@
 import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './App.css';
+import { apiFetch, getCurrentUser } from './session';
 
 function Messages() {
   const [conversations, setConversations] = useState([]);
   const [loading, setLoading] = useState(true);
   const [message, setMessage] = useState('');
   const [currentUser, setCurrentUser] = useState(null);
-  const email = localStorage.getItem('loggedInEmail');
+  const sessionUser = getCurrentUser();
   const navigate = useNavigate();
 
   const fetchUserAndConversations = async () => {
-    if (!email) return;
+    const user = sessionUser;
+    if (!user) return;
 
     try {
-      // Get current user
-      const usersRes = await fetch('http://127.0.0.1:5000/users');
-      const users = await usersRes.json();
-      const user = users.find(u => u.email === email);
-      
-      if (!user) return;
-      
-      // Check for updated profile picture in localStorage
-      const storedProfilePic = localStorage.getItem(`profile_pic_${user.email}`);
-      if (storedProfilePic) {
-        user.profile_pic = storedProfilePic;
-      }
       setCurrentUser(user);
 
       // Get conversations
-      const conversationsRes = await fetch(`http://127.0.0.1:5000/conversations/${user.id}`);
-      const conversationsData = await conversationsRes.json();
+      const conversationsRes = await apiFetch(`http://127.0.0.1:5000/conversations/${user.id}`);
+      const { conversations: conversationsData } = await conversationsRes.json();
       setConversations(conversationsData);
     } catch (error) {
       setMessage('Error loading conversations');
@@ -42,7 +32,7 @@ function Messages() {
 
   useEffect(() => {
     fetchUserAndConversations();
-  }, [email]);
+  }, [sessionUser?.id]);
 
   const handleStartChat = (userId, userName) => {
     navigate(`/chat/${userId}`, { state: { userName } });
@@ -2,47 +2,38 @@ import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './AuthForm.css';
 import './Profile.css';
+import { apiFetch, getCurrentUser } from './session';
 
 function MyRelationships() {
   const [relationships, setRelationships] = useState([]);
   const [pending, setPending] = useState([]);
   const [message, setMessage] = useState('');
   const [currentUser, setCurrentUser] = useState(null);
-  const email = localStorage.getItem('loggedInEmail');
+  const sessionUser = getCurrentUser();
   const navigate = useNavigate();
 
   const fetchRelationships = async () => {
-    if (!email) return;
-
     let user = currentUser;
     if (!user) {
-        const usersRes = await fetch('http://127.0.0.1:5000/users');
-        const users = await usersRes.json();
-        user = users.find(u => u.email === email);
+        user = sessionUser;
         if (!user) return;
-        
-        // Check for updated profile picture in localStorage
-        const storedProfilePic = localStorage.getItem(`profile_pic_${user.email}`);
-        if (storedProfilePic) {
-          user.profile_pic = storedProfilePic;
-        }
         setCurrentUser(user);
     }
 
     // Accepted relationships
-    const relRes = await fetch(`http://127.0.0.1:5000/relationships/${user.id}`);
+    const relRes = await apiFetch(`http://127.0.0.1:5000/relationships/${user.id}`);
     const rels = await relRes.json();
     setRelationships(rels);
 
     // Pending requests sent by this user
-    const pendingRes = await fetch(`http://127.0.0.1:5000/connect_requests_sent/${user.id}`);
+    const pendingRes = await apiFetch(`http://127.0.0.1:5000/connect_requests_sent/${user.id}`);
     const pendings = await pendingRes.json();
     setPending(pendings);
   };
 
   useEffect(() => {
     fetchRelationships();
-  }, [email]);
+  }, [sessionUser?.id]);
 
   const handleViewProfile = (userId) => {
     // If the user clicks on their own profile, navigate to /profile (not /profile/:id)
@@ -56,11 +47,10 @@ function MyRelationships() {
   const handleEditRelationship = async (relationshipId, newRelationshipType) => {
     if (!currentUser) return;
 
-    const res = await fetch(`http://127.0.0.1:5000/edit_relationship/${relationshipId}`, {
+    const res = await apiFetch(`http://127.0.0.1:5000/edit_relationship/${relationshipId}`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({
-        requesting_user_id: currentUser.id,
         new_relationship_type: newRelationshipType
       })
     });
@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import './Profile.css';
+import { apiFetch, getCurrentUser, updateCurrentUser } from './session';
 
 function Profile() {
   const [user, setUser] = useState(null);
@@ -9,17 +10,18 @@ function Profile() {
   const [uploading, setUploading] = useState(false);
   const [message, setMessage] = useState('');
   const [formData, setFormData] = useState({});
-  const email = localStorage.getItem("loggedInEmail");
+  const sessionUser = getCurrentUser();
 
   const fetchUserData = async () => {
-    if (email) {
+    if (sessionUser) {
       try {
         console.log('Fetching user data from backend...');
-        const response = await fetch("http://127.0.0.1:5000/users");
-        const data = await response.json();
-        const found = data.find(u => u.email === email);
+        // Our own profile, with private fields included
+        const response = await apiFetch(`http://127.0.0.1:5000/profile/${sessionUser.id}`);
+        const found = response.ok ? await response.json() : null;
         console.log('User data from backend:', found);
         if (found) {
+          updateCurrentUser({ name: found.name, profile_pic: found.profile_pic });
           // Check for updated profile picture in localStorage
           const storedProfilePic = localStorage.getItem(`profile_pic_${found.email}`);
           if (storedProfilePic) {
@@ -46,7 +48,7 @@ function Profile() {
 
   useEffect(() => {
     fetchUserData();
-  }, [email]);
+  }, [sessionUser?.id]);
 
   // Only fetch user data when exiting edit mode (not when profile pic is uploaded)
   useEffect(() => {
@@ -96,7 +98,7 @@ function Profile() {
       reader.onload = async (e) => {
         const base64Image = e.target.result;
 
-        const response = await fetch(`http://127.0.0.1:5000/update_profile/${user.id}`, {
+        const response = await apiFetch(`http://127.0.0.1:5000/update_profile/${user.id}`, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ profile_pic: base64Image })
@@ -144,7 +146,7 @@ function Profile() {
     if (!user) return;
 
     try {
-      const response = await fetch(`http://127.0.0.1:5000/update_profile/${user.id}`, {
+      const response = await apiFetch(`http://127.0.0.1:5000/update_profile/${user.id}`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(formData)
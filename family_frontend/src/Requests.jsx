@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from 'react';
 import './AuthForm.css';
+import { apiFetch, getCurrentUser } from './session';
 
 function Requests() {
   const [requests, setRequests] = useState([]);
@@ -7,7 +8,7 @@ function Requests() {
   const [message, setMessage] = useState('');
   const [currentUser, setCurrentUser] = useState(null);
   const [reverseRelationships, setReverseRelationships] = useState({});
-  const email = localStorage.getItem('loggedInEmail');
+  const sessionUser = getCurrentUser();
 
   const relationshipOptions = [
     { value: '', label: 'Select relationship...' },
@@ -23,25 +24,21 @@ function Requests() {
   ];
 
   const fetchAllRequests = async () => {
-    if (!email) return;
+    if (!sessionUser) return;
 
-    // Fetch current user once
+    // The current user comes from the session saved at login
     if (!currentUser) {
-      const usersRes = await fetch('http://127.0.0.1:5000/users');
-      const users = await usersRes.json();
-      const user = users.find(u => u.email === email);
-      if (!user) return;
-      setCurrentUser(user);
+      setCurrentUser(sessionUser);
     }
 
     if (currentUser) {
       // Fetch connection requests
-      const reqRes = await fetch(`http://127.0.0.1:5000/relationship_requests/${currentUser.id}`);
+      const reqRes = await apiFetch(`http://127.0.0.1:5000/relationship_requests/${currentUser.id}`);
       const reqs = await reqRes.json();
       setRequests(reqs);
 
       // Fetch relationship edit requests
-      const editReqRes = await fetch(`http://127.0.0.1:5000/relationship_edit_requests/${currentUser.id}`);
+      const editReqRes = await apiFetch(`http://127.0.0.1:5000/relationship_edit_requests/${currentUser.id}`);
       const editReqs = await editReqRes.json();
       setEditRequests(editReqs);
     }
@@ -49,7 +46,7 @@ function Requests() {
 
   useEffect(() => {
     fetchAllRequests();
-  }, [email, currentUser]);
+  }, [sessionUser?.id, currentUser]);
 
   const handleRespond = async (request_id, status, reverseRelationshipType = null) => {
     const payload = { status };
@@ -61,7 +58,7 @@ function Requests() {
       payload.reverse_relationship_type = reverseRelationshipType;
     }
 
-    const res = await fetch(`http://127.0.0.1:5000/respond_relationship/${request_id}`, {
+    const res = await apiFetch(`http://127.0.0.1:5000/respond_relationship/${request_id}`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload)
@@ -76,7 +73,7 @@ function Requests() {
   };
 
   const handleEditResponse = async (request_id, status) => {
-    const res = await fetch(`http://127.0.0.1:5000/respond_edit_request/${request_id}`, {
+    const res = await apiFetch(`http://127.0.0.1:5000/respond_edit_request/${request_id}`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ status })
@@ -89,7 +86,7 @@ function Requests() {
     }
   };
 
-  if (!email) return null;
+  if (!sessionUser) return null;
 
   return (
     <div className="page-card">
@@ -1,6 +1,7 @@
 import React, { useEffect, useState } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import './Profile.css';
+import { apiFetch, getCurrentUser } from './session';
 
 function ViewProfile() {
   const [profileData, setProfileData] = useState(null);
@@ -9,31 +10,10 @@ function ViewProfile() {
   const [currentUser, setCurrentUser] = useState(null);
   const { userId } = useParams();
   const navigate = useNavigate();
-  const email = localStorage.getItem("loggedInEmail");
 
   useEffect(() => {
-    const fetchCurrentUser = async () => {
-      if (email) {
-        try {
-          const response = await fetch("http://127.0.0.1:5000/users");
-          const users = await response.json();
-          const user = users.find(u => u.email === email);
-          
-          // Check for updated profile picture in localStorage
-          if (user) {
-            const storedProfilePic = localStorage.getItem(`profile_pic_${user.email}`);
-            if (storedProfilePic) {
-              user.profile_pic = storedProfilePic;
-            }
-          }
-          setCurrentUser(user);
-        } catch (error) {
-          console.error('Error fetching current user:', error);
-        }
-      }
-    };
-    fetchCurrentUser();
-  }, [email]);
+    setCurrentUser(getCurrentUser());
+  }, []);
 
   useEffect(() => {
     const fetchProfile = async () => {
@@ -41,7 +21,7 @@ function ViewProfile() {
 
       setLoading(true);
       try {
-        const response = await fetch(`http://127.0.0.1:5000/profile/${userId}?requesting_user_id=${currentUser.id}`);
+        const response = await apiFetch(`http://127.0.0.1:5000/profile/${userId}`);
 
         if (response.ok) {
           const data = await response.json();
@@ -0,0 +1,105 @@
+// The signed-in user's session token and profile, saved at login so pages
+// don't have to look the current user up again.
+const SESSION_KEY = 'session';
+
+export function getSession() {
+  try {
+    return JSON.parse(localStorage.getItem(SESSION_KEY));
+  } catch {
+    return null;
+  }
+}
+
+export function saveSession(token, user) {
+  localStorage.setItem(SESSION_KEY, JSON.stringify({ token, user }));
+}
+
+export function clearSession() {
+  localStorage.removeItem(SESSION_KEY);
+}
+
+export function getCurrentUser() {
+  const session = getSession();
+  if (!session) return null;
+  const user = { ...session.user };
+  // Check for updated profile picture in localStorage
+  const storedProfilePic = localStorage.getItem(`profile_pic_${user.email}`);
+  if (storedProfilePic) {
+    user.profile_pic = storedProfilePic;
+  }
+  return user;
+}
+
+export function updateCurrentUser(fields) {
+  const session = getSession();
+  if (session) saveSession(session.token, { ...session.user, ...fields });
+}
+
+// fetch() with the session token attached
+export function apiFetch(url, options = {}) {
+  const session = getSession();
+  const headers = { ...options.headers };
+  if (session) headers.Authorization = `Bearer ${session.token}`;
+  return fetch(url, { ...options, headers });
+}
+
+// EventSource can't send headers, so the stream is opened with a short-lived ticket
+// rather than the session token, which must not end up in URLs or server logs
+function eventsUrl(userId) {
+  const base = `http://127.0.0.1:5000/events/${userId}`;
+  if (!getSession()) return Promise.resolve(base);
+  return apiFetch('http://127.0.0.1:5000/auth/stream_ticket', { method: 'POST' })
+    .then(res => (res.ok ? res.json() : Promise.reject(new Error(`stream ticket: ${res.status}`))))
+    .then(({ ticket }) => `${base}?ticket=${encodeURIComponent(ticket)}`);
+}
+
+// One /events stream per tab, shared by every component listening to it: each open
+// stream holds a server thread, so pages must not open their own.
+let events = null;
+
+function openEvents(current) {
+  eventsUrl(current.userId)
+    .then(url => {
+      if (events !== current) return;
+      const source = new EventSource(url);
+      current.listeners.forEach(([type, handler]) => source.addEventListener(type, handler));
+      // EventSource retries dropped connections with the same URL, but gives up once the
+      // server refuses it (an expired ticket, or 503 when the server is full)
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) reopenEvents(current);
+      };
+      current.source = source;
+    })
+    .catch(() => reopenEvents(current));
+}
+
+function reopenEvents(current) {
+  if (events !== current) return;
+  if (current.source) current.source.close();
+  current.source = null;
+  current.retry = setTimeout(() => openEvents(current), 5000);
+}
+
+function closeEvents() {
+  clearTimeout(events.retry);
+  if (events.source) events.source.close();
+  events = null;
+}
+
+export function subscribeEvents(userId, type, handler) {
+  if (events && events.userId !== userId) closeEvents();
+  if (!events) {
+    events = { userId, source: null, listeners: [], retry: null };
+    openEvents(events);
+  }
+  const current = events;
+  const listener = [type, handler];
+  current.listeners.push(listener);
+  if (current.source) current.source.addEventListener(type, handler);
+
+  return () => {
+    current.listeners = current.listeners.filter(l => l !== listener);
+    if (current.source) current.source.removeEventListener(type, handler);
+    if (current.listeners.length === 0 && events === current) closeEvents();
+  };
+}